@@ -0,0 +1,244 @@
+# backend/admission.py
+"""DBプール飽和に連動したアドミッション制御（ASGIミドルウェア）
+
+- 同時実行数の上限 = DBプール容量（pool_size + max_overflow）を初期値に、
+  観測したリクエスト処理時間で適応的に増減（gradient 方式）
+- 優先度ごとの有界キュー（書き込み > 通常 > 一覧系の重い読み込み）
+- 推定待ち時間が予算を超えたら即 503 + Retry-After（プールのタイムアウトまで待たせない）
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# 優先度（数値が小さいほど優先）
+PRIORITY_WRITE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# 一覧系の重い読み込み（全件取得）
+BULK_READ_PATHS = {"/allcustomers", "/items", "/sample"}
+# 制御対象外（DB を使わない）
+EXEMPT_PATHS = {"/", "/docs", "/openapi.json", "/redoc"}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def classify(method: str, path: str) -> int:
+    """メソッドとパスから優先度を決める"""
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return PRIORITY_WRITE
+    if path in BULK_READ_PATHS:
+        return PRIORITY_BULK
+    return PRIORITY_NORMAL
+
+
+class Rejected(Exception):
+    """キュー満杯 / 待ち時間予算超過"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"overloaded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class AdaptiveLimit:
+    """処理時間に基づく同時実行数の適応制御（Netflix concurrency-limits の Gradient2 方式）
+
+    limit = limit * clamp(tolerance * 長期平均rtt / 短期平均rtt, 0.5, 1.0) + sqrt(limit)
+    - 詰まっていない（短期平均が長期平均の tolerance 倍以内）ときは limit が上限まで増える
+    - DB プール待ちなどで短期平均が伸びると limit が縮む
+
+    rtt はエンドポイントごとに別々に平均する。点検索と全件読みのように所要時間が
+    桁違いのものを 1 本にまとめると、負荷がなくても比率がずれて limit が縮んでしまうため。
+    """
+
+    MAX_KEYS = 256  # これを超えた新しいキーは "*" にまとめる
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: Optional[int] = None,
+                 short_smoothing: float = 0.2, long_smoothing: float = 0.01,
+                 tolerance: float = 2.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit or initial
+        self.short_smoothing = short_smoothing
+        self.long_smoothing = long_smoothing
+        self.tolerance = tolerance
+        self._rtts: Dict[str, list] = {}  # key -> [短期平均, 長期平均]
+        self._lock = threading.Lock()  # 同期エンドポイントはワーカースレッドから来る
+
+    def observe(self, rtt: float, key: str = "*") -> None:
+        with self._lock:
+            avg = self._rtts.get(key)
+            if avg is None and len(self._rtts) >= self.MAX_KEYS:
+                key = "*"
+                avg = self._rtts.get(key)
+            if avg is None:
+                self._rtts[key] = [rtt, rtt]
+                return
+            avg[0] += self.short_smoothing * (rtt - avg[0])
+            avg[1] += self.long_smoothing * (rtt - avg[1])
+
+            gradient = max(0.5, min(1.0, self.tolerance * avg[1] / avg[0])) if avg[0] > 0 else 1.0
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+            self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+    @property
+    def current(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+
+class AdmissionController:
+    """優先度付き有界キュー + 適応 limit による入場制御（イベントループ上で使う）"""
+
+    def __init__(self, limit: AdaptiveLimit, queue_sizes: Dict[int, int],
+                 wait_budgets: Dict[int, float]):
+        self.limit = limit
+        self.queue_sizes = queue_sizes
+        self.wait_budgets = wait_budgets
+        self.in_flight = 0
+        self._waiters: list[Tuple[int, int, asyncio.Future]] = []
+        self._counts = {p: 0 for p in queue_sizes}
+        self._seq = itertools.count()
+        # 平均処理時間（リクエスト単位）。待ち時間の推定に使う
+        self.service_time = 0.05
+
+    def _queued_ahead(self, priority: int) -> int:
+        return sum(n for p, n in self._counts.items() if p <= priority)
+
+    def estimate_wait(self, priority: int) -> float:
+        """自分より前に並ぶ件数 / limit × 平均処理時間"""
+        ahead = self._queued_ahead(priority) + 1
+        return ahead / self.limit.current * self.service_time
+
+    async def acquire(self, priority: int) -> None:
+        if self.in_flight < self.limit.current and not self._waiters:
+            self.in_flight += 1
+            return
+
+        budget = self.wait_budgets[priority]
+        est = self.estimate_wait(priority)
+        if self._counts[priority] >= self.queue_sizes[priority] or est > budget:
+            raise Rejected(retry_after=max(1.0, est))
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        self._counts[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=budget)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # タイムアウトと同時に枠が割り当てられた場合は受け入れる
+                return
+            fut.cancel()
+            raise Rejected(retry_after=max(1.0, self.estimate_wait(priority)))
+        except asyncio.CancelledError:
+            # クライアント切断など。割り当て済みの枠は返す
+            if fut.done() and not fut.cancelled():
+                self.release(self.service_time)
+            else:
+                fut.cancel()
+            raise
+        finally:
+            if not fut.done() or fut.cancelled():
+                self._discard(entry)
+
+    def _discard(self, entry) -> None:
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self._waiters)
+        self._counts[entry[0]] -= 1
+
+    def release(self, elapsed: float, key: Optional[str] = None) -> None:
+        """枠を返す。key（エンドポイント）があれば処理時間を limit に反映する"""
+        self.service_time += 0.2 * (elapsed - self.service_time)
+        if key is not None:
+            self.limit.observe(elapsed, key)
+        self.in_flight -= 1
+        # 空いた枠を優先度の高い順に渡す
+        while self._waiters and self.in_flight < self.limit.current:
+            priority, _, fut = heapq.heappop(self._waiters)
+            self._counts[priority] -= 1
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+
+
+class AdmissionControlMiddleware:
+    """FastAPI に add_middleware で組み込む ASGI ミドルウェア"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        priority = classify(scope["method"], scope["path"])
+        try:
+            await self.controller.acquire(priority)
+        except Rejected as e:
+            await _send_503(send, e.retry_after)
+            return
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - started, _endpoint_key(scope))
+
+
+def _endpoint_key(scope) -> str:
+    # ルーティング後は scope に endpoint が入る（パスパラメータ違いを 1 つにまとめる）
+    endpoint = scope.get("endpoint")
+    name = getattr(endpoint, "__name__", None) or scope["path"]
+    return f"{scope['method']} {name}"
+
+
+async def _send_503(send, retry_after: float) -> None:
+    body = b'{"detail":"Service overloaded"}'
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(int(math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def build_controller(engine) -> AdmissionController:
+    """エンジンのプール容量と環境変数から controller を組み立てる"""
+    pool = engine.pool
+    capacity = pool.size() + getattr(pool, "_max_overflow", 0)
+    limit = AdaptiveLimit(initial=capacity, min_limit=1, max_limit=capacity,
+                          tolerance=_env_float("ADMISSION_TOLERANCE", 2.0))
+    return AdmissionController(
+        limit,
+        queue_sizes={
+            PRIORITY_WRITE: int(_env_float("ADMISSION_QUEUE_WRITE", 50)),
+            PRIORITY_NORMAL: int(_env_float("ADMISSION_QUEUE_NORMAL", 30)),
+            PRIORITY_BULK: int(_env_float("ADMISSION_QUEUE_BULK", 10)),
+        },
+        wait_budgets={
+            PRIORITY_WRITE: _env_float("ADMISSION_BUDGET_WRITE_SEC", 2.0),
+            PRIORITY_NORMAL: _env_float("ADMISSION_BUDGET_NORMAL_SEC", 1.0),
+            PRIORITY_BULK: _env_float("ADMISSION_BUDGET_BULK_SEC", 0.5),
+        },
+    )
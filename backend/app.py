@@ -1,23 +1,31 @@
 # backend/app.py
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from datetime import datetime
+from sqlalchemy import text, select, update, delete
+from datetime import date, datetime
 from decimal import Decimal
 from uuid import uuid4
+import os
 
 # DB: セッションを一本化
 # from db_control.session import get_db
 # ORMモデル
 # from db_control.models import Sample, Customers, Items
 
-from .db_control.session import get_db
-from .db_control.models import Sample, Customers, Items
+from .db_control.session import get_db, engine
+from .db_control.models import Sample, Customers, Items, Jobs
+from .db_control import catalog, crud, jobs, recommend
+from .db_control.history import fetch_purchase_history
+from .db_control.shards import get_customer_db, get_router
+from .admission import AdmissionControlMiddleware, build_controller
 
 app = FastAPI()
 
+# DBプール飽和時は待たせずに 503 + Retry-After（書き込みを一覧読み込みより優先）
+app.add_middleware(AdmissionControlMiddleware, controller=build_controller(engine))
+
 # CORS（Next.js から叩く場合は必要）
 app.add_middleware(
     CORSMiddleware,
@@ -68,105 +76,210 @@ def list_sample(limit: int = 50, db: Session = Depends(get_db)):
     rows = db.query(Sample).order_by(Sample.id.desc()).limit(limit).all()
     return [SampleOut(id=r.id, name=r.name, created_at=r.created_at) for r in rows]
 
-# ===== customers（ORM版） =====
+# ===== 楽観的排他制御（version 列 + If-Match） =====
+def _expected_version(if_match: str | None, body_version: int | None = None) -> int | None:
+    """If-Match: "3" / W/"3" / 3 → 3（ヘッダ優先、無ければ body の version、どちらも無ければ無条件）"""
+    if if_match is None or if_match.strip() == "*":
+        return body_version
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a version number")
+
+def _required_version(if_match: str | None, body_version: int | None = None) -> int:
+    """PUT 用：無条件の上書き（後勝ち）は受け付けない。GET で得た version を渡してもらう"""
+    expected = _expected_version(if_match, body_version)
+    if expected is None:
+        raise HTTPException(status_code=428, detail="If-Match (or version in the body) is required")
+    return expected
+
+def _missing_or_conflict(db: Session, pk_col, pk_value, not_found: str):
+    """条件付き UPDATE/DELETE が 0 件のときだけ、404 か 409 かを判定する"""
+    if db.execute(select(pk_col).where(pk_col == pk_value)).first() is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    raise HTTPException(status_code=409, detail="Version conflict")
+
+# ===== 列の絞り込み（?fields=a,b,c → SELECT a, b, c） =====
+FIELDS_QUERY = Query(None, description="返す列をカンマ区切りで指定（例: customer_id,customer_name）")
+
+def _select_fields(model, fields: str | None, default: list[str]):
+    try:
+        return crud.resolve_fields(model, fields, default)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ===== customers（ORM版、customer_id の持ち主シャードで読み書き） =====
 class Customer(BaseModel):
     customer_id: str
     customer_name: str
     age: int
     gender: str
+    version: int | None = None  # If-Match の代わりに body で渡してもよい
 
 @app.post("/customers")
-def create_customer(customer: Customer, db: Session = Depends(get_db)):
+def create_customer(customer: Customer):
     obj = Customers(
         customer_id=customer.customer_id,
         customer_name=customer.customer_name,
         age=customer.age,
         gender=customer.gender,
     )
-    try:
-        db.add(obj)
-        db.commit()
-        db.refresh(obj)
-    except Exception:
-        db.rollback()
-        # 一意制約違反などを409で返す（IntegrityErrorもここに入る）
-        raise HTTPException(status_code=409, detail="Customer already exists")
-    return {
-        "customer_id": obj.customer_id,
-        "customer_name": obj.customer_name,
-        "age": obj.age,
-        "gender": obj.gender,
-    }
+    # customer_id は body にあるので依存性ではなくここでシャードを選ぶ
+    with get_router().session_for(customer.customer_id) as db:
+        try:
+            db.add(obj)
+            db.commit()
+            db.refresh(obj)
+        except Exception:
+            db.rollback()
+            # 一意制約違反などを409で返す（IntegrityErrorもここに入る）
+            raise HTTPException(status_code=409, detail="Customer already exists")
+        return {
+            "customer_id": obj.customer_id,
+            "customer_name": obj.customer_name,
+            "age": obj.age,
+            "gender": obj.gender,
+            "version": obj.version,
+        }
 
 @app.get("/customers")
-def read_one_customer(customer_id: str = Query(...), db: Session = Depends(get_db)):
+def read_one_customer(response: Response, customer_id: str = Query(...), db: Session = Depends(get_customer_db)):
     obj = db.get(Customers, customer_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Customer not found")
+    response.headers["ETag"] = f'"{obj.version}"'
     return {
         "customer_id": obj.customer_id,
         "customer_name": obj.customer_name,
         "age": obj.age,
         "gender": obj.gender,
+        "version": obj.version,
     }
 
+CUSTOMER_LIST_FIELDS = ["customer_id", "customer_name", "age", "gender"]
+
 @app.get("/allcustomers")
-def read_all_customer(db: Session = Depends(get_db)):
-    rows = db.query(Customers).order_by(Customers.customer_id).all()
-    return [
-        {
-            "customer_id": r.customer_id,
-            "customer_name": r.customer_name,
-            "age": r.age,
-            "gender": r.gender,
-        }
-        for r in rows
-    ]
+def read_all_customer(fields: str | None = FIELDS_QUERY):
+    cols = _select_fields(Customers, fields, CUSTOMER_LIST_FIELDS)
+    # 全シャードに並列で投げて customer_id 順にマージ（並べ替え用に customer_id は必ず取る）
+    sort_col = [] if any(c.key == "customer_id" for c in cols) else [Customers.customer_id]
+    stmt = select(*cols, *sort_col).order_by(Customers.customer_id)
+    rows = get_router().fan_out(
+        lambda db: db.execute(stmt).mappings().all(),
+        key=lambda r: r["customer_id"],
+    )
+    keys = [c.key for c in cols]
+    return [{k: r[k] for k in keys} for r in rows]
 
-@app.put("/customers")
-def update_customer(customer: Customer, db: Session = Depends(get_db)):
-    obj = db.get(Customers, customer.customer_id)
-    if not obj:
+@app.get("/customers/{customer_id}/purchases")
+def read_customer_purchases(
+    customer_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    before_date: date | None = None,
+    before_id: str | None = None,
+    db: Session = Depends(get_customer_db),
+):
+    # 1ページあたりのクエリ数は履歴の量によらず固定（history.QUERIES_PER_PAGE）
+    result = fetch_purchase_history(db, customer_id, limit, before_date, before_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    obj.customer_name = customer.customer_name
-    obj.age = customer.age
-    obj.gender = customer.gender
-    db.commit()
-    db.refresh(obj)
+    return result
+
+@app.put("/customers")
+def update_customer(
+    customer: Customer,
+    response: Response,
+    if_match: str | None = Header(None),
+):
+    # 読んでから書くのではなく UPDATE ... WHERE customer_id = ? AND version = ? の 1 文で更新
+    expected = _required_version(if_match, customer.version)
+    stmt = (
+        update(Customers)
+        .where(Customers.customer_id == customer.customer_id, Customers.version == expected)
+        .values(
+            customer_name=customer.customer_name,
+            age=customer.age,
+            gender=customer.gender,
+            version=Customers.version + 1,
+        )
+    )
+    with get_router().session_for(customer.customer_id) as db:
+        result = db.execute(stmt)
+        db.commit()
+        if result.rowcount == 0:
+            _missing_or_conflict(db, Customers.customer_id, customer.customer_id, "Customer not found")
+
+    # 条件付き更新なので新しい version は確定している（再読込しない）
+    new_version = expected + 1
+    response.headers["ETag"] = f'"{new_version}"'
     return {
-        "customer_id": obj.customer_id,
-        "customer_name": obj.customer_name,
-        "age": obj.age,
-        "gender": obj.gender,
+        "customer_id": customer.customer_id,
+        "customer_name": customer.customer_name,
+        "age": customer.age,
+        "gender": customer.gender,
+        "version": new_version,
     }
 
 @app.delete("/customers")
-def delete_customer(customer_id: str = Query(...), db: Session = Depends(get_db)):
-    obj = db.get(Customers, customer_id)
-    if not obj:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    db.delete(obj)
+def delete_customer(
+    customer_id: str = Query(...),
+    if_match: str | None = Header(None),
+    db: Session = Depends(get_customer_db),
+):
+    expected = _expected_version(if_match)
+    stmt = delete(Customers).where(Customers.customer_id == customer_id)
+    if expected is not None:
+        stmt = stmt.where(Customers.version == expected)
+    result = db.execute(stmt)
     db.commit()
+    if result.rowcount == 0:
+        _missing_or_conflict(db, Customers.customer_id, customer_id, "Customer not found")
     return {"customer_id": customer_id, "status": "deleted"}
 
 # ===== Items API（DBの主キー item_id に合わせた版） =====
+def _after_items_write(db: Session):
+    """items のコミット後に呼ぶ。ここで失敗しても書き込みは済んでいるので 500 にはしない
+
+    - 共有カタログを新しい版に差し替え（失敗しても読み手が catalog_state.version を見て作り直す）
+    - 購入明細との JOIN 用に items を全シャードへ複製する sync_items ジョブを積む
+      （1 シャード構成なら何もしない。複製そのものはランナーが行う）
+    """
+    try:
+        catalog.publish_from_db(db)
+    except Exception as e:
+        db.rollback()
+        print(f"[items] catalog publish failed (readers will republish): {e!r}", flush=True)
+    if len(get_router().names) > 1:
+        try:
+            jobs.submit(db, "sync_items")
+        except Exception as e:
+            db.rollback()
+            print(f"[items] could not queue sync_items: {e!r}", flush=True)
+
 class ItemIn(BaseModel):
     item_name: str
     price: Decimal
 
+# 補助列 id は既定では返さない（必要なら ?fields=...,id）
+ITEM_LIST_FIELDS = ["item_id", "item_name", "price", "created_at", "version"]
+
 @app.get("/items")
-def list_items(db: Session = Depends(get_db)):
-    rows = db.query(Items).order_by(Items.created_at.desc()).all()
-    return [
-        {
-            "item_id": r.item_id,
-            "item_name": r.item_name,
-            "price": str(r.price),  # Decimal を文字列化
-            "id": r.id,             # 補助列（使わなければ無視）
-            "created_at": r.created_at,
-        }
-        for r in rows
-    ]
+def list_items(fields: str | None = FIELDS_QUERY, db: Session = Depends(get_db)):
+    cols = _select_fields(Items, fields, ITEM_LIST_FIELDS)
+    keys = [c.key for c in cols]
+    if set(keys) <= set(catalog.FIELDS):
+        # 共有カタログ（mmap）から返す。DB には問い合わせない
+        return [{k: r[k] for k in keys} for r in _get_catalog(db).items(newest_first=True)]
+    # カタログに無い列（id）を指定されたときだけ DB から読む
+    rows = db.execute(select(*cols).order_by(Items.created_at.desc())).mappings().all()
+    out = [dict(r) for r in rows]
+    if any(c.key == "price" for c in cols):
+        for r in out:
+            r["price"] = str(r["price"])  # Decimal を文字列化
+    return out
 
 @app.post("/items")
 def create_item(payload: ItemIn, db: Session = Depends(get_db)):
@@ -182,15 +295,150 @@ def create_item(payload: ItemIn, db: Session = Depends(get_db)):
             id=next_int_id,
         )
         db.add(obj)
+        catalog.bump_version(db)
         db.commit()
         db.refresh(obj)
-        return {
-            "item_id": obj.item_id,
-            "item_name": obj.item_name,
-            "price": str(obj.price),
-            "id": obj.id,
-            "created_at": obj.created_at,
-        }
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"create_item failed: {e}")
+    created = {
+        "item_id": obj.item_id,
+        "item_name": obj.item_name,
+        "price": str(obj.price),
+        "id": obj.id,
+        "created_at": obj.created_at,
+        "version": obj.version,
+    }
+    _after_items_write(db)
+    return created
+
+@app.put("/items/{item_id}")
+def update_item(
+    item_id: str,
+    payload: ItemIn,
+    response: Response,
+    if_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    expected = _required_version(if_match)
+    stmt = (
+        update(Items)
+        .where(Items.item_id == item_id, Items.version == expected)
+        .values(item_name=payload.item_name, price=payload.price, version=Items.version + 1)
+    )
+    result = db.execute(stmt)
+    if result.rowcount:
+        catalog.bump_version(db)
+    db.commit()
+    if result.rowcount == 0:
+        _missing_or_conflict(db, Items.item_id, item_id, "Item not found")
+    _after_items_write(db)
+
+    new_version = expected + 1
+    response.headers["ETag"] = f'"{new_version}"'
+    return {
+        "item_id": item_id,
+        "item_name": payload.item_name,
+        "price": str(payload.price),
+        "version": new_version,
+    }
+
+@app.delete("/items/{item_id}")
+def delete_item(item_id: str, if_match: str | None = Header(None), db: Session = Depends(get_db)):
+    expected = _expected_version(if_match)
+    stmt = delete(Items).where(Items.item_id == item_id)
+    if expected is not None:
+        stmt = stmt.where(Items.version == expected)
+    result = db.execute(stmt)
+    if result.rowcount:
+        catalog.bump_version(db)
+    db.commit()
+    if result.rowcount == 0:
+        _missing_or_conflict(db, Items.item_id, item_id, "Item not found")
+    _after_items_write(db)
+    return {"item_id": item_id, "status": "deleted"}
+
+# ===== 商品カタログ（全ワーカー共有の mmap スナップショットから返す） =====
+def _get_catalog(db: Session) -> catalog.Catalog:
+    # 無ければ DB から作り、数秒おきに catalog_state.version と突き合わせて古ければ作り直す
+    # （複数ワーカーが同時に作っても os.replace で安全）
+    return catalog.refresh_from_db(db)
+
+@app.get("/catalog/items")
+def list_catalog_items(db: Session = Depends(get_db)):
+    cat = _get_catalog(db)
+    return {"version": cat.version, "items": cat.items()}
+
+@app.get("/catalog/items/{item_id}")
+def read_catalog_item(item_id: str, db: Session = Depends(get_db)):
+    price = _get_catalog(db).price(item_id)
+    if price is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {"item_id": item_id, "price": str(price)}
+
+# ===== 一緒に買われている商品（メモリ上のスナップショットから返す） =====
+@app.get("/items/{item_id}/related")
+def related_items(item_id: str, k: int = Query(10, ge=1, le=recommend.DEFAULT_TOP_K)):
+    index = recommend.get_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Recommendation snapshot not built yet")
+    return {"item_id": item_id, "related": index.related(item_id, k)}
+
+# ===== バックグラウンドジョブ（重い処理は jobs テーブルに積んでランナーで実行） =====
+_job_runner: jobs.JobRunner | None = None
+
+@app.on_event("startup")
+def start_job_runner():
+    global _job_runner
+    # 既定では起動しない（`python -m backend.db_control.jobs worker` を別プロセスで動かす）。
+    # ジョブの DB 操作が API の接続プールを取り合わないように。開発用に同居させるなら JOB_RUNNER=on
+    if os.getenv("JOB_RUNNER", "off").lower() == "on":
+        _job_runner = jobs.JobRunner()
+        _job_runner.start()
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    if _job_runner is not None:
+        _job_runner.stop(wait=False)
+
+class JobIn(BaseModel):
+    job_type: str
+    params: dict = {}
+
+@app.post("/jobs", status_code=202)
+def submit_job(payload: JobIn, db: Session = Depends(get_db)):
+    try:
+        obj = jobs.submit(db, payload.job_type, payload.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return jobs.to_dict(obj)
+
+@app.get("/jobs")
+def list_jobs(
+    status: str | None = None,
+    job_type: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    stmt = select(Jobs).order_by(Jobs.created_at.desc()).limit(limit)
+    if status:
+        stmt = stmt.where(Jobs.status == status)
+    if job_type:
+        stmt = stmt.where(Jobs.job_type == job_type)
+    return [jobs.to_dict(r) for r in db.execute(stmt).scalars()]
+
+@app.get("/jobs/{job_id}")
+def read_job(job_id: str, db: Session = Depends(get_db)):
+    obj = db.get(Jobs, job_id)
+    if not obj:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.to_dict(obj)
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, db: Session = Depends(get_db)):
+    outcome = jobs.cancel(db, job_id)
+    if outcome == "not_found":
+        raise HTTPException(status_code=404, detail="Job not found")
+    if outcome == "finished":
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return {"job_id": job_id, "status": outcome}
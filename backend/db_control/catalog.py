@@ -0,0 +1,265 @@
+# backend/db_control/catalog.py
+"""商品カタログの共有メモリ・スナップショット
+
+items（item_id, item_name, price, created_at, version）は小さく読み込みが多いので、
+ワーカーごとに DB へ問い合わせず、ホストに 1 つのバイナリファイルを mmap して全プロセスで共有する。
+
+ファイル構成（リトルエンディアン）::
+
+    header   : magic "CATL" / format(u32) / version(u64) / n(u32) / names_len(u32)
+    ids      : n × 10 byte（item_id 昇順、NUL 詰め）
+    prices   : n × int64（1/100 円単位の固定小数点）
+    created  : n × int64（created_at、1970-01-01 からのマイクロ秒）
+    versions : n × int64（items.version）
+    offsets  : (n + 1) × uint32（names 内の開始位置）
+    names    : UTF-8 を連結したバッファ
+
+- numpy.frombuffer で mmap を直接参照するのでコピーは発生しない
+- 更新は一時ファイルに書いて os.replace でアトミックに差し替え。読み手は
+  inode の変化を見て新しい版を開き直す（古い mmap は参照が切れた時点で閉じる）
+- 版番号は items を変更したトランザクションで増やす catalog_state.version。
+  items と同じトランザクションで読むので、先に読んだワーカーが後から書き出しても
+  新しい版を古い版で上書きしない（DB を作り直したときは publish_from_db(force=True)）
+- 読み手は DB_CHECK_INTERVAL ごとに catalog_state.version を見て（refresh_from_db）、
+  別ホストや crud 経由の変更・DB の復元で版がずれていれば書き直す
+- 既定の置き場所は /dev/shm（tmpfs）。無ければ一時ディレクトリ
+"""
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import select, update
+
+from .models import CatalogState, Items
+
+MAGIC = b"CATL"
+FORMAT = 2
+ID_WIDTH = 10
+_HEADER = struct.Struct("<4sIQII")
+_EPOCH = datetime(1970, 1, 1)
+_MICRO = timedelta(microseconds=1)
+# スナップショットから返せる列（それ以外は DB から読む）
+FIELDS = ("item_id", "item_name", "price", "created_at", "version")
+
+
+def _default_path() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "tech0_item_catalog.bin")
+
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", _default_path())
+CHECK_INTERVAL = 0.5  # 秒。版の確認（stat）の間隔
+DB_CHECK_INTERVAL = float(os.getenv("CATALOG_DB_CHECK_SECONDS", "5"))  # 秒。DB の版との突き合わせ間隔
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+# ===== 書き込み側 =====
+def _read_version(path: str) -> Optional[int]:
+    try:
+        with open(path, "rb") as f:
+            magic, fmt, version, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return None
+    return version if magic == MAGIC and fmt == FORMAT else None
+
+
+def write_snapshot(rows: Iterable[tuple], version: int, path: str = CATALOG_PATH,
+                   force: bool = False) -> int:
+    """(item_id, item_name, price, created_at, version) の列から版 version のスナップショットを
+    作って差し替える。既に同じか新しい版があれば差し替えない（force=True を除く）。
+    差し替え後に置かれている版番号を返す"""
+    global _checked_at
+    rows = sorted(rows, key=lambda r: r[0])
+    n = len(rows)
+    ids = np.array([r[0].encode("utf-8") for r in rows], dtype=f"S{ID_WIDTH}")
+    prices = np.array([int(Decimal(r[2]) * 100) for r in rows], dtype="<i8")
+    created = np.array([(r[3].replace(tzinfo=None) - _EPOCH) // _MICRO for r in rows], dtype="<i8")
+    versions = np.array([r[4] for r in rows], dtype="<i8")
+    encoded = [r[1].encode("utf-8") for r in rows]
+    offsets = np.zeros(n + 1, dtype="<u4")
+    if n:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    names = b"".join(encoded)
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, version, n, len(names)))
+        for block in (ids.tobytes(), prices.tobytes(), created.tobytes(),
+                      versions.tobytes(), offsets.tobytes()):
+            f.write(block)
+            f.write(b"\0" * (_align8(len(block)) - len(block)))
+        f.write(names)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # 版の比較と差し替えの間に他のプロセスが割り込まないようにロックする
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        current = _read_version(path)
+        if not force and current is not None and current >= version:
+            os.unlink(tmp)
+            return current
+        os.replace(tmp, path)
+    _checked_at = 0.0  # このプロセスでは次の参照で新しい版を開く
+    return version
+
+
+def bump_version(session) -> None:
+    """items を変更するトランザクションの中で呼ぶ（コミットは呼び出し側）"""
+    result = session.execute(
+        update(CatalogState).where(CatalogState.id == 1).values(version=CatalogState.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(CatalogState(id=1, version=1))
+        session.flush()
+
+
+def publish_from_db(session, path: str = CATALOG_PATH, force: bool = False) -> int:
+    """items テーブルからスナップショットを作る（商品の追加・変更をコミットしたあとに呼ぶ）"""
+    # 版番号と items を同じトランザクション（同じ読み取りスナップショット）で読む
+    version = session.execute(
+        select(CatalogState.version).where(CatalogState.id == 1)
+    ).scalar() or 0
+    rows = session.execute(
+        select(Items.item_id, Items.item_name, Items.price, Items.created_at, Items.version)
+    ).all()
+    return write_snapshot(rows, version, path, force=force)
+
+
+# ===== 読み込み側 =====
+class Catalog:
+    """mmap したスナップショット（読み取り専用）"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, self.version, n, names_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f"unsupported catalog file: {path}")
+
+        pos = _HEADER.size
+        self.ids = np.frombuffer(self._mm, dtype=f"S{ID_WIDTH}", count=n, offset=pos)
+        pos += _align8(n * ID_WIDTH)
+        self.prices = np.frombuffer(self._mm, dtype="<i8", count=n, offset=pos)
+        pos += _align8(n * 8)
+        self.created = np.frombuffer(self._mm, dtype="<i8", count=n, offset=pos)
+        pos += _align8(n * 8)
+        self.versions = np.frombuffer(self._mm, dtype="<i8", count=n, offset=pos)
+        pos += _align8(n * 8)
+        self.offsets = np.frombuffer(self._mm, dtype="<u4", count=n + 1, offset=pos)
+        pos += _align8((n + 1) * 4)
+        self._names = memoryview(self._mm)[pos:pos + names_len]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _keys(item_ids: Iterable[str]) -> np.ndarray:
+        # S10 に入らない ID は切り詰めると別の商品に当たるので、一致しない値に置き換える
+        encoded = [s.encode("utf-8") for s in item_ids]
+        return np.array([b if len(b) <= ID_WIDTH and b"\0" not in b else b"" for b in encoded],
+                        dtype=f"S{ID_WIDTH}")
+
+    def _index(self, keys: np.ndarray) -> np.ndarray:
+        """item_id の位置（二分探索、見つからなければ -1）"""
+        n = len(self.ids)
+        if n == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, keys), n - 1)
+        return np.where((self.ids[pos] == keys) & (keys != b""), pos, -1)
+
+    def name_at(self, i: int) -> str:
+        return bytes(self._names[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def price(self, item_id: str) -> Optional[Decimal]:
+        i = int(self._index(self._keys([item_id]))[0])
+        if i < 0:
+            return None
+        return Decimal(int(self.prices[i])).scaleb(-2)
+
+    def prices_cents(self, item_ids: Iterable[str]) -> np.ndarray:
+        """複数商品の価格（1/100 円単位）をまとめて引く。無い商品は -1"""
+        idx = self._index(self._keys(item_ids))
+        out = np.full(len(idx), -1, dtype=np.int64)
+        hit = idx >= 0
+        out[hit] = self.prices[idx[hit]]
+        return out
+
+    def items(self, newest_first: bool = False) -> list[dict]:
+        """全商品（item_id 順。newest_first=True なら created_at の新しい順）"""
+        ids = self.ids.tolist()
+        prices = self.prices.tolist()
+        created = self.created.tolist()
+        versions = self.versions.tolist()
+        order = np.argsort(-self.created, kind="stable").tolist() if newest_first else range(len(ids))
+        return [
+            {
+                "item_id": ids[i].decode("utf-8"),
+                "item_name": self.name_at(i),
+                "price": str(Decimal(prices[i]).scaleb(-2)),
+                "created_at": _EPOCH + created[i] * _MICRO,
+                "version": versions[i],
+            }
+            for i in order
+        ]
+
+
+_lock = threading.Lock()
+_current: Optional[Catalog] = None
+_checked_at = 0.0
+_db_checked_at = 0.0
+
+
+def get_catalog(path: str = CATALOG_PATH) -> Optional[Catalog]:
+    """現在の版を返す。ファイルが差し替えられていたら開き直す（無ければ None）"""
+    global _current, _checked_at
+    now = time.monotonic()
+    if _current is not None and now - _checked_at < CHECK_INTERVAL:
+        return _current
+    with _lock:
+        _checked_at = now
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            return _current
+        if _current is None or _current.inode != inode:
+            try:
+                _current = Catalog(path)
+            except ValueError:
+                return None  # 古い形式のファイル（publish_from_db で書き直される）
+        return _current
+
+
+def refresh_from_db(session, path: str = CATALOG_PATH) -> Optional[Catalog]:
+    """DB_CHECK_INTERVAL ごとに catalog_state.version と比べ、ずれていれば書き直して返す
+
+    DB の方が新しければ通常どおり差し替える。ファイルの方が新しいのは DB を復元したときなので
+    force で書き戻す（直後に別のワーカーが新しい版を書いていても、次の突き合わせで戻る）。
+    """
+    global _db_checked_at
+    cat = get_catalog(path)
+    now = time.monotonic()
+    if cat is not None and now - _db_checked_at < DB_CHECK_INTERVAL:
+        return cat
+    _db_checked_at = now
+    db_version = session.execute(
+        select(CatalogState.version).where(CatalogState.id == 1)
+    ).scalar() or 0
+    if cat is None or db_version != cat.version:
+        publish_from_db(session, path, force=cat is not None and db_version < cat.version)
+        cat = get_catalog(path)
+    return cat
@@ -1,41 +1,44 @@
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import IntegrityError
 
-from db_control.connect_MySQL import engine
-from db_control.mymodels_MySQL import Base, Customers
+try:
+    # パッケージとして import された場合（ジョブランナーなど）
+    from .connect_MySQL import engine
+    from .mymodels_MySQL import Base, Customers
+    from . import crud
+except ImportError:
+    # backend ディレクトリからスクリプトとして実行した場合
+    from db_control.connect_MySQL import engine
+    from db_control.mymodels_MySQL import Base, Customers
+    from db_control import crud
 
 # セッションファクトリ（共通で使い回し）
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def init_db() -> None:
-    """存在しないテーブルのみ作成（冪等）"""
+def init_db(engines=None) -> None:
+    """存在しないテーブルのみ作成（冪等）。engines を渡すとそれぞれに作る（シャード構成用）"""
     print("Creating tables if not exist ...")
-    Base.metadata.create_all(bind=engine)
+    for target in engines or [engine]:
+        Base.metadata.create_all(bind=target)
     print("Done.")
 
 
 def insert_sample_data() -> None:
-    """customers の初期データ（冪等：既にあればスキップ）"""
+    """customers の初期データ（冪等：既にあればスキップ）
+
+    crud 経由で customer_id の持ち主シャードに入れる（DB_SHARD_URLS が無ければ main）。
+    """
     seed = [
-        Customers(customer_id="C1111", customer_name="ああさん", age=6, gender="男"),
-        Customers(customer_id="C110",  customer_name="桃太郎さん", age=30, gender="女"),
+        {"customer_id": "C1111", "customer_name": "ああさん", "age": 6, "gender": "男"},
+        {"customer_id": "C110", "customer_name": "桃太郎さん", "age": 30, "gender": "女"},
     ]
 
-    with SessionLocal() as session:
-        try:
-            # 既存チェック（PK重複を避ける）
-            for c in seed:
-                if session.get(Customers, c.customer_id) is None:
-                    session.add(c)
-            session.commit()
-            print("Sample data inserted or already present.")
-        except IntegrityError:
-            session.rollback()
-            print("Some sample rows already existed. Skipped duplicates.")
-        except Exception as e:
-            session.rollback()
-            raise e
+    # PK 重複は crud が unique_violation として返す
+    results = [crud.myinsert(Customers, values) for values in seed]
+    if "unique_violation" in results:
+        print("Some sample rows already existed. Skipped duplicates.")
+    else:
+        print("Sample data inserted.")
 
 
 if __name__ == "__main__":
@@ -1,41 +1,136 @@
 # backend/db_control/crud.py
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, Optional, Union
 from sqlalchemy import insert, delete, update, select
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from sqlalchemy.exc import IntegrityError
 import json
-import os
 
-# ✅ 接続は db_control.session に一本化
-#   - engine を個別に作らず、同じ SessionLocal を共有
-from .session import SessionLocal  # type: ignore
+# ✅ 接続は db_control.shards のルーター経由に一本化
+#   - 既定は main（= db_control.session の engine）だけの 1 シャード構成
+#   - customers / purchases / purchase_details は customer_id の持ち主シャードへ
+from .shards import MAIN, SHARDED_TABLES, get_router
+from .mymodels_MySQL import Customers, Items
+from . import catalog
 
 def _row_to_dict(obj) -> dict:
     """SQLAlchemy モデル → {col: value} に汎用変換"""
     mapper = sqlalchemy_inspect(obj).mapper
     return {col.key: getattr(obj, col.key) for col in mapper.column_attrs}
 
+def _shards(mymodel, customer_id: Any = None) -> list:
+    """対象シャード名：グローバル表は main、顧客単位の表は持ち主（不明なら全シャード）"""
+    router = get_router()
+    if mymodel.__table__.name not in SHARDED_TABLES:
+        return [MAIN]
+    if customer_id is not None:
+        return [router.shard_for(customer_id)]
+    return router.names
+
+def _bump_catalog(session, table: str) -> None:
+    """items を書いたら共有カタログの版も同じトランザクションで進める（読み手が作り直す）"""
+    if table == Items.__tablename__:
+        catalog.bump_version(session)
+
+def _route_key(values: Dict[str, Any], customer_id: Any = None) -> Any:
+    return customer_id if customer_id is not None else values.get("customer_id")
+
+def _version_col(mymodel):
+    """楽観的排他制御用の version 列（無いモデルは None）"""
+    return mymodel.__table__.c.get("version")
+
+def _missing_or_conflict(names: list, pk_col, pk_value) -> str:
+    """条件付き UPDATE/DELETE が 0 件だったときだけ、原因を SELECT で判定"""
+    router = get_router()
+    for name in names:
+        with router.session(name) as session:
+            if session.execute(select(pk_col).where(pk_col == pk_value)).first():
+                return "conflict"
+    return "not_found"
+
+def resolve_fields(mymodel, fields: Union[str, Iterable[str], None], default: Optional[Iterable[str]] = None) -> list:
+    """'a,b,c' / ['a', 'b'] → テーブルの Column のリスト（未知の列名は ValueError）
+
+    fields が空なら default（未指定なら全列）。SELECT 句に必要な列だけを載せるために使う。
+    """
+    table_cols = mymodel.__table__.c
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    names = list(fields or default or table_cols.keys())
+    unknown = [n for n in names if n not in table_cols]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)} (allowed: {', '.join(table_cols.keys())})")
+    return [table_cols[n] for n in dict.fromkeys(names)]  # 順序を保って重複を除く
+
 def myselect(mymodel, pk_value: Any) -> str:
     """PK で1件取得 → JSON（単一PK想定）"""
-    with SessionLocal() as session:
-        pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
-        rows = session.execute(
-            select(mymodel).where(pk_col == pk_value)
-        ).scalars().all()
-        return json.dumps([_row_to_dict(r) for r in rows], ensure_ascii=False, default=str)
-
-def myselectAll(mymodel) -> str:
-    """全件取得 → JSON"""
-    with SessionLocal() as session:
-        rows = session.execute(select(mymodel)).scalars().all()
-        return json.dumps([_row_to_dict(r) for r in rows], ensure_ascii=False, default=str)
-
-def myinsert(mymodel, values: Dict[str, Any]) -> str:
-    """挿入 → 'inserted:<pk>' / 'unique_violation'"""
-    with SessionLocal() as session:
+    pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
+    customer_id = pk_value if pk_col.key == "customer_id" else None
+    router = get_router()
+    rows = []
+    for name in _shards(mymodel, customer_id):
+        with router.session(name) as session:
+            found = session.execute(
+                select(mymodel).where(pk_col == pk_value)
+            ).scalars().all()
+            rows += [_row_to_dict(r) for r in found]
+    return json.dumps(rows, ensure_ascii=False, default=str)
+
+def myselectAll(mymodel, fields: Union[str, Iterable[str], None] = None) -> str:
+    """全件取得 → JSON（fields 指定時はその列だけを SELECT する）
+
+    シャード化された表は全シャードに並列で投げ、PK 順にマージする。
+    """
+    pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
+    names = _shards(mymodel)
+    cols = resolve_fields(mymodel, fields) if fields else None
+    # マージには各シャードの結果が PK 順である必要がある
+    merge_key = None
+    if len(names) > 1 and (cols is None or pk_col.key in {c.key for c in cols}):
+        merge_key = lambda r: r[pk_col.key]
+
+    if cols is not None:
+        stmt = select(*cols)
+        if merge_key:
+            stmt = stmt.order_by(pk_col)
+        fetch = lambda s: [dict(r) for r in s.execute(stmt).mappings()]
+    else:
+        stmt = select(mymodel)
+        if merge_key:
+            stmt = stmt.order_by(pk_col)
+        fetch = lambda s: [_row_to_dict(r) for r in s.execute(stmt).scalars()]
+
+    router = get_router()
+    if len(names) == 1:
+        with router.session(names[0]) as session:
+            rows = fetch(session)
+    else:
+        rows = router.fan_out(fetch, key=merge_key)
+    return json.dumps(rows, ensure_ascii=False, default=str)
+
+def myinsert(mymodel, values: Dict[str, Any], customer_id: Any = None) -> str:
+    """挿入 → 'inserted:<pk>' / 'unique_violation' / 'customer_not_found'
+
+    customer_id 列の無いシャード化された表（purchase_details）は customer_id で行き先を指定する。
+    購入・明細は、行き先のシャードに顧客がいることを FOR SHARE で確かめてから入れる
+    （リシャーディング中の顧客は移動が終わるまで待ち、移動済みなら入れない）。
+    """
+    route_key = _route_key(values, customer_id)
+    names = _shards(mymodel, route_key)
+    if len(names) > 1:
+        raise ValueError(f"customer_id is required to route inserts into {mymodel.__table__.name}")
+    table = mymodel.__table__.name
+    with get_router().session(names[0]) as session:
         try:
+            if table in SHARDED_TABLES and table != Customers.__tablename__:
+                owner = session.execute(
+                    select(Customers.customer_id).where(Customers.customer_id == route_key)
+                    .with_for_update(read=True)
+                ).first()
+                if owner is None:
+                    session.rollback()
+                    return "customer_not_found"
             result = session.execute(insert(mymodel).values(values))
+            _bump_catalog(session, table)
             session.commit()
             # PK返却（AUTO_INCREMENT 等に対応）
             pks = result.inserted_primary_key
@@ -47,45 +142,78 @@ def myinsert(mymodel, values: Dict[str, Any]) -> str:
             session.rollback()
             raise
 
-def myupdate(mymodel, values: Dict[str, Any]) -> str:
-    """更新 → 'updated' / 'not_found' / 'unique_violation' / 'missing_<pk>' / 'no_changes'"""
-    pk_name = sqlalchemy_inspect(mymodel).primary_key[0].key
+def _execute_write(names: list, stmt) -> int:
+    """持ち主シャード（不明なら全シャード）に順に投げ、最初に当たった件数を返す"""
+    router = get_router()
+    for name in names:
+        with router.session(name) as session:
+            try:
+                result = session.execute(stmt)
+                if result.rowcount:
+                    _bump_catalog(session, stmt.table.name)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            if result.rowcount:
+                return result.rowcount
+    return 0
+
+def myupdate(mymodel, values: Dict[str, Any], expected_version: Optional[int] = None) -> str:
+    """更新 → 'updated' / 'not_found' / 'conflict' / 'unique_violation' / 'missing_<pk>' / 'no_changes'
+
+    version 列があるモデルは version = version + 1 も同じ UPDATE 文で行う。
+    expected_version を渡すと WHERE pk = ? AND version = ? の 1 文で条件付き更新し、
+    他で先に更新されていれば 'conflict' を返す。
+    """
+    pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
+    pk_name = pk_col.key
     pk_value = values.get(pk_name)
     if pk_value is None:
         return f"missing_{pk_name}"
 
-    update_values = {k: v for k, v in values.items() if k != pk_name}
+    version_col = _version_col(mymodel)
+    if expected_version is not None and version_col is None:
+        raise ValueError(f"{mymodel.__name__} has no version column")
+
+    update_values = {k: v for k, v in values.items() if k not in (pk_name, "version")}
     if not update_values:
         return "no_changes"
 
-    with SessionLocal() as session:
-        try:
-            pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
-            result = session.execute(
-                update(mymodel).where(pk_col == pk_value).values(**update_values)
-            )
-            session.commit()
-            return "updated" if result.rowcount else "not_found"
-        except IntegrityError:
-            session.rollback()
-            return "unique_violation"
-        except Exception:
-            session.rollback()
-            raise
+    stmt = update(mymodel).where(pk_col == pk_value).values(**update_values)
+    if version_col is not None:
+        stmt = stmt.values({version_col.key: version_col + 1})
+        if expected_version is not None:
+            stmt = stmt.where(version_col == expected_version)
 
-def mydelete(mymodel, pk_value: Any) -> str:
-    """削除 → '<pk> is deleted' / 'not_found' / 'unique_violation'"""
-    with SessionLocal() as session:
-        try:
-            pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
-            result = session.execute(delete(mymodel).where(pk_col == pk_value))
-            session.commit()
-            return f"{pk_value} is deleted" if result.rowcount else "not_found"
-        except IntegrityError:
-            session.rollback()
-            return "unique_violation"
-        except Exception:
-            session.rollback()
-            raise
+    names = _shards(mymodel, _route_key(values))
+    try:
+        if _execute_write(names, stmt):
+            return "updated"
+    except IntegrityError:
+        return "unique_violation"
+    if expected_version is None:
+        return "not_found"
+    return _missing_or_conflict(names, pk_col, pk_value)
+
+def mydelete(mymodel, pk_value: Any, expected_version: Optional[int] = None) -> str:
+    """削除 → '<pk> is deleted' / 'not_found' / 'conflict' / 'unique_violation'"""
+    pk_col = sqlalchemy_inspect(mymodel).primary_key[0]
+    stmt = delete(mymodel).where(pk_col == pk_value)
+    if expected_version is not None:
+        version_col = _version_col(mymodel)
+        if version_col is None:
+            raise ValueError(f"{mymodel.__name__} has no version column")
+        stmt = stmt.where(version_col == expected_version)
+
+    names = _shards(mymodel, pk_value if pk_col.key == "customer_id" else None)
+    try:
+        if _execute_write(names, stmt):
+            return f"{pk_value} is deleted"
+    except IntegrityError:
+        return "unique_violation"
+    if expected_version is None:
+        return "not_found"
+    return _missing_or_conflict(names, pk_col, pk_value)
 
 
@@ -0,0 +1,106 @@
+# backend/db_control/history.py
+"""顧客の購入履歴（N+1 なし）
+
+リレーションを遅延ロードでたどると「購入ごと・明細ごと」に SQL が飛ぶため、
+1ページあたり固定 3 本のクエリで取得する。
+
+1. 顧客の存在確認
+2. 購入の 1 ページ分（合計金額は SQL で集計、(purchase_date, purchase_id) のキーセット）
+3. そのページの明細（商品名・単価を JOIN、行小計 quantity * price も SQL で計算）
+
+purchases は月次パーティション分割されているが、ここではパーティションの刈り込みは
+ほとんど効かない。1 ページ目は日付の下限が無いので各パーティションの
+ix_purchases_customer_date を 1 回ずつ引き、2 ページ目以降も before_date より新しい
+パーティションが外れるだけ。コストはパーティション数に比例するので、古い月は
+partitions.py の archive --purge で落としておく。
+"""
+from datetime import date
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from .mymodels_MySQL import Customers, Items, Purchases, PurchaseDetails
+
+QUERIES_PER_PAGE = 3
+
+
+def fetch_purchase_history(
+    db: Session,
+    customer_id: str,
+    limit: int = 20,
+    before_date: Optional[date] = None,
+    before_id: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """新しい順に 1 ページ分返す。顧客がいなければ None"""
+    exists = db.execute(
+        select(Customers.customer_id).where(Customers.customer_id == customer_id)
+    ).first()
+    if exists is None:
+        return None
+
+    line_total = PurchaseDetails.quantity * Items.price
+    page_stmt = (
+        select(
+            Purchases.purchase_id,
+            Purchases.purchase_date,
+            func.coalesce(func.sum(line_total), 0).label("total"),
+        )
+        .outerjoin(PurchaseDetails, PurchaseDetails.purchase_id == Purchases.purchase_id)
+        .outerjoin(Items, Items.item_id == PurchaseDetails.item_id)
+        .where(Purchases.customer_id == customer_id)
+        .group_by(Purchases.purchase_id, Purchases.purchase_date)
+        .order_by(Purchases.purchase_date.desc(), Purchases.purchase_id.desc())
+        .limit(limit + 1)  # 次ページの有無を判定するため 1 件多く取る
+    )
+    if before_date is not None:
+        cond = Purchases.purchase_date < before_date
+        if before_id is not None:
+            cond = or_(cond, and_(Purchases.purchase_date == before_date,
+                                  Purchases.purchase_id < before_id))
+        page_stmt = page_stmt.where(cond)
+
+    page = db.execute(page_stmt).all()
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    lines: Dict[str, list] = {p.purchase_id: [] for p in page}
+    if page:
+        detail_rows = db.execute(
+            select(
+                PurchaseDetails.purchase_id,
+                PurchaseDetails.detail_id,
+                PurchaseDetails.item_id,
+                Items.item_name,
+                Items.price,
+                PurchaseDetails.quantity,
+                line_total.label("line_total"),
+            )
+            .join(Items, Items.item_id == PurchaseDetails.item_id)
+            .where(PurchaseDetails.purchase_id.in_(list(lines)))
+            .order_by(PurchaseDetails.purchase_id, PurchaseDetails.detail_id)
+        ).all()
+        for d in detail_rows:
+            lines[d.purchase_id].append({
+                "detail_id": d.detail_id,
+                "item_id": d.item_id,
+                "item_name": d.item_name,
+                "price": str(d.price),
+                "quantity": d.quantity,
+                "line_total": str(d.line_total),
+            })
+
+    purchases = [
+        {
+            "purchase_id": p.purchase_id,
+            "purchase_date": p.purchase_date,
+            "total": str(p.total),
+            "details": lines[p.purchase_id],
+        }
+        for p in page
+    ]
+    next_cursor = None
+    if has_next:
+        last = page[-1]
+        next_cursor = {"before_date": last.purchase_date, "before_id": last.purchase_id}
+    return {"customer_id": customer_id, "purchases": purchases, "next": next_cursor}
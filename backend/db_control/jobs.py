@@ -0,0 +1,450 @@
+# backend/db_control/jobs.py
+"""バックグラウンドジョブ
+
+重い処理（シード投入、レコメンド再構築、アーカイブなど）を HTTP リクエストの中で
+実行せず、jobs テーブルに積んでランナーが実行する。
+
+- ジョブの状態は DB に永続化（queued → running → succeeded / failed / cancelled）
+- CPU を使う処理はプロセスプール、I/O 待ちが中心の処理はスレッドプールで実行
+- ジョブ種別ごとの同時実行数の上限（全ランナー合計。取得の UPDATE 文の中で
+  その種別の running 件数と比べる）
+- 取得は UPDATE ... WHERE status = 'queued' の条件付き更新で行うので、
+  ランナーが複数プロセスにあっても同じジョブを二重に実行しない
+- ランナーは自分が持っているジョブ（runner_id）のハートビートを定期的に更新し、
+  ハートビートが stale_after 以上途絶えた running（落ちたランナーのジョブ）を failed にする
+- 進捗は ctx.report()、キャンセルは ctx.check_cancelled() でジョブ側から協調的に行う
+- プロセスプールは fork ではなく forkserver（無ければ spawn）で起動する。スレッド
+  （ランナー自身・API のワーカー）を持つプロセスを fork すると、ロックや接続を
+  握ったままの状態を子が引き継ぐため
+
+ランナーは単体で動かす（API の接続プールと取り合わないように別プロセス）::
+
+    python -m backend.db_control.jobs worker
+
+開発用に API プロセス内で動かす場合は JOB_RUNNER=on。
+"""
+from __future__ import annotations
+
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import func, literal, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .models import Jobs
+
+PROCESS = "process"
+THREAD = "thread"
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """ジョブ内で ctx.check_cancelled() がキャンセル要求を検出した"""
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    func: Callable[..., Any]
+    kind: str = THREAD        # PROCESS（CPU バウンド）/ THREAD（I/O バウンド）
+    concurrency: int = 1      # 同時実行数の上限
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def job(name: str, kind: str = THREAD, concurrency: int = 1):
+    """ジョブ種別の登録（プロセスプールで pickle できるよう、モジュール直下の関数に付ける）"""
+
+    def register(func):
+        JOB_TYPES[name] = JobType(name, func, kind, concurrency)
+        return func
+
+    return register
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _session() -> Session:
+    from .session import SessionLocal
+
+    return SessionLocal()
+
+
+# ===== ジョブ側から使う =====
+class JobContext:
+    """進捗報告とキャンセル確認（ワーカーのプロセス / スレッド内で使う）"""
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._checked_at = 0.0
+        self._cancelled = False
+
+    def report(self, progress: int, message: Optional[str] = None) -> None:
+        with _session() as db:
+            db.execute(
+                update(Jobs).where(Jobs.job_id == self.job_id)
+                .values(progress=max(0, min(100, int(progress))), message=message, heartbeat_at=_now())
+            )
+            db.commit()
+
+    def cancelled(self) -> bool:
+        now = time.monotonic()
+        if not self._cancelled and now - self._checked_at >= self.CHECK_INTERVAL:
+            self._checked_at = now
+            with _session() as db:
+                self._cancelled = bool(db.execute(
+                    select(Jobs.cancel_requested).where(Jobs.job_id == self.job_id)
+                ).scalar())
+        return self._cancelled
+
+    def check_cancelled(self) -> None:
+        if self.cancelled():
+            raise JobCancelled(self.job_id)
+
+
+def _execute(job_type: str, module: str, job_id: str, params: Optional[str]) -> str:
+    """プール内で実行される入口（関数ではなく種別名を渡すので pickle の問題がない）
+
+    spawn / forkserver の子プロセスには登録が引き継がれないので、ジョブを定義した
+    モジュールを import して登録し直す。
+    """
+    if job_type not in JOB_TYPES:
+        importlib.import_module(module)
+    result = JOB_TYPES[job_type].func(JobContext(job_id), **json.loads(params or "{}"))
+    return json.dumps(result, ensure_ascii=False, default=str)
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _init_process_worker() -> None:
+    # 念のため：forkserver が先読みしたモジュールの接続プールは使わない（子プロセスで接続し直す）
+    from . import shards
+    from .session import engine
+
+    engine.dispose(close=False)
+    if shards._router is not None:
+        for shard_engine in shards._router.engines.values():
+            shard_engine.dispose(close=False)
+
+
+# ===== API から使う =====
+def to_dict(obj: Jobs) -> dict:
+    return {
+        "job_id": obj.job_id,
+        "job_type": obj.job_type,
+        "status": obj.status,
+        "progress": obj.progress,
+        "message": obj.message,
+        "params": json.loads(obj.params) if obj.params else {},
+        "result": json.loads(obj.result) if obj.result and obj.status == "succeeded" else obj.result,
+        "cancel_requested": bool(obj.cancel_requested),
+        "runner_id": obj.runner_id,
+        "created_at": obj.created_at,
+        "started_at": obj.started_at,
+        "finished_at": obj.finished_at,
+    }
+
+
+def submit(db: Session, job_type: str, params: Optional[dict] = None) -> Jobs:
+    """ジョブを積む（未知の種別は ValueError）"""
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"unknown job type: {job_type} (available: {', '.join(sorted(JOB_TYPES))})")
+    obj = Jobs(job_id=uuid.uuid4().hex, job_type=job_type, status="queued",
+               params=json.dumps(params or {}, ensure_ascii=False))
+    db.add(obj)
+    db.commit()
+    db.refresh(obj)
+    return obj
+
+
+def cancel(db: Session, job_id: str) -> str:
+    """'cancelled'（待ち行列から外した）/ 'cancel_requested'（実行中に通知）/ 'finished' / 'not_found'"""
+    result = db.execute(
+        update(Jobs).where(Jobs.job_id == job_id, Jobs.status == "queued")
+        .values(status="cancelled", finished_at=_now())
+    )
+    if result.rowcount:
+        db.commit()
+        return "cancelled"
+    result = db.execute(
+        update(Jobs).where(Jobs.job_id == job_id, Jobs.status == "running")
+        .values(cancel_requested=True)
+    )
+    db.commit()
+    if result.rowcount:
+        return "cancel_requested"
+    return "finished" if db.get(Jobs, job_id) is not None else "not_found"
+
+
+# ===== ランナー =====
+class JobRunner:
+    def __init__(self, process_workers: Optional[int] = None, thread_workers: int = 4,
+                 poll_interval: float = 1.0, heartbeat_interval: float = 30.0,
+                 stale_after: float = 600.0):
+        self.process_workers = process_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.thread_workers = thread_workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.runner_id = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, int] = {}
+        self._held: set[str] = set()  # このランナーが running にしたジョブ
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pools: Dict[str, Any] = {}
+        self._beat_at = 0.0
+
+    def start(self) -> None:
+        self._pools = {
+            PROCESS: ProcessPoolExecutor(self.process_workers, mp_context=_mp_context(),
+                                         initializer=_init_process_worker),
+            THREAD: ThreadPoolExecutor(self.thread_workers, thread_name_prefix="job"),
+        }
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """止める。まだ始まっていないジョブは queued に戻す（_finish）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - self._beat_at >= self.heartbeat_interval:
+                    self._heartbeat()
+                    self._reap_stale()
+                    self._beat_at = time.monotonic()
+                self._dispatch_once()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.poll_interval)
+
+    def _dispatch_once(self) -> None:
+        for jt in JOB_TYPES.values():
+            while self._running.get(jt.name, 0) < jt.concurrency:
+                claimed = self._claim(jt)
+                if claimed is None:
+                    break
+                job_id, params = claimed
+                with self._lock:
+                    self._running[jt.name] = self._running.get(jt.name, 0) + 1
+                    self._held.add(job_id)
+                future = self._pools[jt.kind].submit(_execute, jt.name, jt.func.__module__,
+                                                     job_id, params)
+                future.add_done_callback(
+                    lambda f, job_id=job_id, name=jt.name: self._finish(job_id, name, f)
+                )
+
+    def _claim(self, jt: JobType) -> Optional[tuple[str, Optional[str]]]:
+        """最も古い queued を running にする（他のランナーに先を越されたら次を探す）
+
+        同時実行数は同じ UPDATE 文の中で running 件数と比べるので、ランナー（API ワーカー）が
+        いくつあっても全体で jt.concurrency を超えない。MySQL は UPDATE 対象の表を直接
+        サブクエリで読めないため、件数は派生表に包んでから比べる。
+        """
+        running = (
+            select(func.count().label("n")).select_from(Jobs)
+            .where(Jobs.job_type == jt.name, Jobs.status == "running")
+            .correlate(None).subquery()
+        )
+        under_limit = (
+            select(literal(1)).select_from(running).where(running.c.n < jt.concurrency)
+            .correlate(None).exists()
+        )
+        with _session() as db:
+            for _ in range(3):
+                row = db.execute(
+                    select(Jobs.job_id, Jobs.params)
+                    .where(Jobs.status == "queued", Jobs.job_type == jt.name)
+                    .order_by(Jobs.created_at).limit(1)
+                ).first()
+                if row is None:
+                    return None
+                now = _now()
+                try:
+                    result = db.execute(
+                        update(Jobs)
+                        .where(Jobs.job_id == row.job_id, Jobs.status == "queued", under_limit)
+                        .values(status="running", runner_id=self.runner_id,
+                                started_at=now, heartbeat_at=now)
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.commit()
+                except OperationalError:
+                    # 同時に取りに来たランナーとのデッドロック等。次の周回でやり直す
+                    db.rollback()
+                    return None
+                if result.rowcount:
+                    return row.job_id, row.params
+                if not db.execute(under_limit.select()).scalar():
+                    return None  # 上限に達している（他のランナーが実行中）
+        return None
+
+    def _finish(self, job_id: str, job_type: str, future: Future) -> None:
+        with self._lock:
+            self._running[job_type] -= 1
+            self._held.discard(job_id)
+        if future.cancelled():
+            # stop() で始まる前に取り消された。失敗ではないので他のランナーに回す
+            values: Dict[str, Any] = {"status": "queued", "runner_id": None,
+                                      "started_at": None, "heartbeat_at": None}
+        else:
+            values = {"finished_at": _now()}
+            try:
+                values.update(status="succeeded", progress=100, result=future.result())
+            except JobCancelled:
+                values.update(status="cancelled")
+            except BaseException as e:  # プロセスの異常終了（BrokenProcessPool）もここに来る
+                values.update(status="failed", result=f"{type(e).__name__}: {e}"[:10000])
+        with _session() as db:
+            db.execute(
+                update(Jobs)
+                .where(Jobs.job_id == job_id, Jobs.status == "running",
+                       Jobs.runner_id == self.runner_id)
+                .values(**values)
+            )
+            db.commit()
+
+    def _heartbeat(self) -> None:
+        """このランナーが持っている running のハートビートをまとめて更新する"""
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return
+        with _session() as db:
+            db.execute(
+                update(Jobs)
+                .where(Jobs.job_id.in_(held), Jobs.status == "running",
+                       Jobs.runner_id == self.runner_id)
+                .values(heartbeat_at=_now())
+            )
+            db.commit()
+
+    def _reap_stale(self) -> None:
+        """ハートビートが途絶えた running（落ちたランナーのジョブ）を failed にする"""
+        cutoff = _now() - timedelta(seconds=self.stale_after)
+        with _session() as db:
+            db.execute(
+                update(Jobs)
+                .where(Jobs.status == "running",
+                       or_(Jobs.heartbeat_at < cutoff, Jobs.heartbeat_at.is_(None)))
+                .values(status="failed", result="runner lost", finished_at=_now())
+            )
+            db.commit()
+
+
+# ===== 組み込みジョブ =====
+@job("seed_sample", kind=THREAD)
+def seed_sample(ctx: JobContext) -> dict:
+    from .create_tables_MySQL import init_db, insert_sample_data
+    from .shards import get_router
+
+    ctx.report(10, "creating tables")
+    init_db(get_router().engines.values())
+    ctx.report(60, "inserting sample data")  # 顧客は持ち主のシャードへ（crud 経由）
+    insert_sample_data()
+    return {"seeded": True}
+
+
+@job("rebuild_recommendations", kind=PROCESS)
+def rebuild_recommendations(ctx: JobContext, incremental: bool = True) -> dict:
+    from . import recommend
+    from .shards import get_router
+
+    if incremental and os.path.exists(recommend.SNAPSHOT_PATH):
+        index = recommend.CooccurrenceIndex.load(recommend.SNAPSHOT_PATH)
+    else:
+        index = recommend.CooccurrenceIndex()
+
+    def on_chunk(purchases: int) -> None:
+        ctx.check_cancelled()
+        ctx.report(50, f"{purchases} purchases ingested")
+
+    ctx.report(5, "reading purchases")
+    n = recommend.update_from_router(get_router(), index, on_chunk=on_chunk)
+    ctx.check_cancelled()
+    ctx.report(90, "saving snapshot")
+    index.save(recommend.SNAPSHOT_PATH)
+    return {"purchases": n, "items": len(index.item_ids)}
+
+
+@job("publish_catalog", kind=THREAD)
+def publish_catalog(ctx: JobContext) -> dict:
+    from . import catalog
+
+    with _session() as db:
+        # 明示的な再発行なので、手元のファイルの版が DB より新しくても（DB を作り直した等）置き換える
+        return {"version": catalog.publish_from_db(db, force=True)}
+
+
+@job("sync_items", kind=THREAD)
+def sync_items(ctx: JobContext) -> dict:
+    from .shards import get_router, sync_reference_tables
+
+    router = get_router()
+    sync_reference_tables(router)
+    return {"shards": router.names}
+
+
+@job("archive_purchases", kind=PROCESS)
+def archive_purchases(ctx: JobContext, keep_months: int = 12, purge: bool = False) -> dict:
+    from . import partitions
+    from .shards import get_router
+
+    archived = []
+    for shard, engine in get_router().engines.items():
+        ctx.check_cancelled()
+        with engine.connect() as conn:
+            done = partitions.archive_old(conn, keep_months=keep_months, purge=purge, shard=shard)
+            conn.commit()
+        archived += [{"shard": shard, "partition": name, "rows": n} for name, n in done]
+    return {"archived": archived}
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="background job runner")
+    parser.add_argument("cmd", choices=["worker"])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    runner = JobRunner(process_workers=args.processes, thread_workers=args.threads)
+    runner.start()
+    print(f"job runner started: {', '.join(sorted(JOB_TYPES))}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # backend/db_control/models.py
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import (
-    Column, Integer, String, DateTime, MetaData, Numeric, text, Index
+    Column, Integer, BigInteger, String, DateTime, MetaData, Numeric, text, Index, Text, Boolean
 )
 
 NAMING_CONVENTION = {
@@ -25,6 +25,8 @@ class Customers(Base):
     customer_name = Column(String(100), nullable=False)
     age = Column(Integer, nullable=False)
     gender = Column(String(10), nullable=False)
+    # 楽観的排他制御（UPDATE ... WHERE version = ? で競合を検出）
+    version = Column(Integer, nullable=False, server_default=text("1"))
 
 Index("ix_customers_customer_name", Customers.customer_name)
 
@@ -34,8 +36,36 @@ class Items(Base):
     item_name = Column(String(100), nullable=False, index=True)
     price = Column(Numeric(10, 2), nullable=False)
     id = Column(Integer)  # DBにあるので残す（主キーではない）
+    version = Column(Integer, nullable=False, server_default=text("1"))
     created_at = Column(
         DateTime(timezone=True),
         server_default=text("CURRENT_TIMESTAMP"),
         nullable=False,
     )
+
+class CatalogState(Base):
+    """items の変更回数（共有カタログの版番号。db_control/catalog.py）"""
+    __tablename__ = "catalog_state"
+    id = Column(Integer, primary_key=True)  # 常に 1 行（id=1）
+    version = Column(BigInteger, nullable=False, server_default=text("0"))
+
+class Jobs(Base):
+    """バックグラウンドジョブ（db_control/jobs.py のランナーが拾って実行する）"""
+    __tablename__ = "jobs"
+    job_id = Column(String(32), primary_key=True)
+    job_type = Column(String(50), nullable=False)
+    # queued → running → succeeded / failed / cancelled
+    status = Column(String(20), nullable=False, server_default=text("'queued'"))
+    params = Column(Text, nullable=True)   # JSON
+    result = Column(Text, nullable=True)   # JSON / エラーメッセージ
+    progress = Column(Integer, nullable=False, server_default=text("0"))  # 0〜100
+    message = Column(String(255), nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, server_default=text("0"))
+    created_at = Column(DateTime(timezone=True), server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # 実行中のランナーが定期的に更新（止まったランナーの検出に使う）
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    runner_id = Column(String(64), nullable=True)  # running にしたランナー（host:pid:乱数）
+
+Index("ix_jobs_status_type_created", Jobs.status, Jobs.job_type, Jobs.created_at)
@@ -1,5 +1,5 @@
 # backend/db_control/mymodels_MySQL.py
-from sqlalchemy import String, Integer, ForeignKey, Date, DECIMAL, UniqueConstraint
+from sqlalchemy import String, Integer, ForeignKey, Date, DECIMAL, UniqueConstraint, Index, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 class Base(DeclarativeBase):
@@ -14,6 +14,8 @@ class Customers(Base):
     customer_name: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
     age: Mapped[int] = mapped_column(Integer, nullable=False)
     gender: Mapped[str] = mapped_column(String(10), nullable=False)
+    # 楽観的排他制御（UPDATE ... WHERE version = ? で競合を検出）
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("1"))
 
     # 関連
     purchases: Mapped[list["Purchases"]] = relationship(
@@ -28,14 +30,21 @@ class Items(Base):
     item_name: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
     # 金額は小数安全に
     price: Mapped[float] = mapped_column(DECIMAL(10, 2), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("1"))
 
     details: Mapped[list["PurchaseDetails"]] = relationship(
         back_populates="item", passive_deletes=True
     )
 
 class Purchases(Base):
+    # DB 上は purchase_date で月次パーティション分割済み（主キーは (purchase_id, purchase_date)、
+    # FK はトリガーで代替）。ORM では従来どおり purchase_id を識別子・FK として扱う
     __tablename__ = "purchases"
-    __table_args__ = {"mysql_engine": "InnoDB", "mysql_charset": "utf8mb4"}
+    __table_args__ = (
+        # 顧客ごとの購入履歴（新しい順のキーセット）用
+        Index("ix_purchases_customer_date", "customer_id", "purchase_date", "purchase_id"),
+        {"mysql_engine": "InnoDB", "mysql_charset": "utf8mb4"},
+    )
 
     purchase_id: Mapped[str] = mapped_column(String(10), primary_key=True)
 
@@ -0,0 +1,312 @@
+# backend/db_control/partitions.py
+"""purchases の月次パーティション運用
+
+purchases は purchase_date で月ごとに RANGE COLUMNS パーティション分割されている
+（マイグレーション b7e2c41d9a03）。パーティション名は p{YYYYMM}、末尾は pmax。
+
+- roll    : 先の月のパーティションを pmax から切り出して用意する
+- archive : 古い月を Parquet（zstd）に書き出し、確認後に MySQL から削除する。
+  書き出し済み（_manifest.json がある）の月は書き直さないので、--purge が途中で
+  止まっても再実行すれば同じアーカイブに対して削除の続きから再開する
+- 集計側は read_archive() で Parquet を pyarrow.dataset として読める
+- purchases は customer_id でシャードに分かれている（shards.py）ので、CLI は全シャードの
+  パーティションを順に処理し、アーカイブもシャードごとに shard=<名前> の下へ置く
+
+パーティションの刈り込みが効くのは purchase_date の下限で絞るクエリ（レコメンドの
+読み直しなど）。顧客ごとの購入履歴は全パーティションの索引を引くので（history.py）、
+パーティション数を keep_months 程度に保つことがそのまま履歴のコストを抑えることになる。
+
+CLI::
+
+    python -m backend.db_control.partitions list
+    python -m backend.db_control.partitions roll --ahead 3
+    python -m backend.db_control.partitions archive --keep-months 12 --dir archive --purge
+"""
+from __future__ import annotations
+
+import json
+import os
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection
+
+from .shards import MAIN
+
+TABLE = "purchases"
+ARCHIVE_DIR = os.getenv("PURCHASES_ARCHIVE_DIR", "archive")
+PURGE_BATCH = 1000
+ARCHIVE_BATCH = 10000  # 書き出し時に一度に読む行数（= Parquet の row group）
+
+
+def month_start(d: date, offset: int = 0) -> date:
+    """d の月初から offset か月ずらした月初"""
+    m = d.year * 12 + (d.month - 1) + offset
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(first_day: date) -> str:
+    return f"p{first_day:%Y%m}"
+
+
+def partition_clause(first_day: date) -> str:
+    """その月（first_day 〜 翌月初の前日）のパーティション定義"""
+    return (f"PARTITION {partition_name(first_day)} "
+            f"VALUES LESS THAN ('{month_start(first_day, 1).isoformat()}')")
+
+
+def list_partitions(conn: Connection) -> list[dict]:
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound, TABLE_ROWS AS rows_est"
+        " FROM information_schema.PARTITIONS"
+        " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL"
+        " ORDER BY PARTITION_ORDINAL_POSITION"
+    ), {"t": TABLE}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _monthly(conn: Connection) -> list[date]:
+    """月次パーティションの月初の一覧（pmax を除く、古い順）"""
+    months = []
+    for p in list_partitions(conn):
+        name = p["name"]
+        if len(name) == 7 and name.startswith("p") and name[1:].isdigit():
+            months.append(date(int(name[1:5]), int(name[5:7]), 1))
+    return months
+
+
+def roll_forward(conn: Connection, ahead: int = 3, today: Optional[date] = None) -> list[str]:
+    """今月から ahead か月先までのパーティションを pmax から切り出す"""
+    today = today or date.today()
+    months = _monthly(conn)
+    nxt = month_start(months[-1], 1) if months else month_start(today)
+    target = month_start(today, ahead)
+    created = []
+    while nxt <= target:
+        # pmax が空なら REORGANIZE はメタデータ操作だけで終わる
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO ("
+            f"{partition_clause(nxt)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        ))
+        created.append(partition_name(nxt))
+        nxt = month_start(nxt, 1)
+    return created
+
+
+# ===== アーカイブ =====
+def _archive_path(archive_dir: str, first_day: date, shard: str = MAIN) -> str:
+    # hive 形式（shard=.../month=YYYY-MM）にしておくと pyarrow.dataset がそのまま列として扱える
+    return os.path.join(archive_dir, TABLE, f"shard={shard}", f"month={first_day:%Y-%m}",
+                        "part-0.parquet")
+
+
+def _manifest_path(archive_dir: str, first_day: date, shard: str = MAIN) -> str:
+    # "_" 始まりは pyarrow.dataset が読み飛ばす
+    return os.path.join(os.path.dirname(_archive_path(archive_dir, first_day, shard)),
+                        "_manifest.json")
+
+
+def _read_manifest(archive_dir: str, first_day: date, shard: str = MAIN) -> Optional[dict]:
+    try:
+        with open(_manifest_path(archive_dir, first_day, shard), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(archive_dir: str, first_day: date, shard: str, manifest: dict) -> None:
+    path = _manifest_path(archive_dir, first_day, shard)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _count(conn: Connection, name: str) -> tuple[int, int]:
+    """(購入数, 購入 × 明細の行数)"""
+    purchases = conn.execute(text(f"SELECT COUNT(*) FROM {TABLE} PARTITION ({name})")).scalar_one()
+    rows = conn.execute(text(
+        f"SELECT COUNT(*) FROM {TABLE} PARTITION ({name}) AS p"
+        " LEFT JOIN purchase_details AS d ON d.purchase_id = p.purchase_id"
+    )).scalar_one()
+    return int(purchases), int(rows)
+
+
+def archive_partition(conn: Connection, first_day: date, archive_dir: str = ARCHIVE_DIR,
+                      shard: str = MAIN) -> int:
+    """1か月分の購入と明細を 1 行 = 1 明細 に平坦化して Parquet(zstd) に書き出す。行数を返す
+
+    書き出しが済んだ月（マニフェストがある）は書き直さずに、その行数を返す。
+    purge の途中で明細が消えた状態から書き直すと、正しいアーカイブを失うため。
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    manifest = _read_manifest(archive_dir, first_day, shard)
+    if manifest is not None:
+        return manifest["rows"]
+
+    name = partition_name(first_day)
+    schema = pa.schema([
+        ("purchase_id", pa.string()),
+        ("customer_id", pa.string()),
+        ("purchase_date", pa.date32()),
+        ("detail_id", pa.string()),
+        ("item_id", pa.string()),
+        ("quantity", pa.int32()),
+    ])
+    path = _archive_path(archive_dir, first_day, shard)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+
+    # 1 か月分を丸ごと読まず、サーバー側カーソルで ARCHIVE_BATCH 行ずつ row group にして書く
+    result = conn.execute(text(
+        "SELECT p.purchase_id, p.customer_id, p.purchase_date,"
+        "       d.detail_id, d.item_id, d.quantity"
+        f" FROM {TABLE} PARTITION ({name}) AS p"
+        " LEFT JOIN purchase_details AS d ON d.purchase_id = p.purchase_id"
+        " ORDER BY p.purchase_date, p.purchase_id, d.detail_id"
+    ).execution_options(yield_per=ARCHIVE_BATCH))
+    rows = purchases = 0
+    last_purchase = None
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        for chunk in result.partitions():
+            columns = list(zip(*chunk))
+            writer.write_batch(pa.record_batch(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            rows += len(chunk)
+            # purchase_id 順に並んでいるので、値が変わった回数が購入数
+            for purchase_id in columns[0]:
+                if purchase_id != last_purchase:
+                    purchases += 1
+                    last_purchase = purchase_id
+    os.replace(tmp, path)
+    # マニフェストが「書き出し完了」の印。これより前に落ちた場合は次回書き直す
+    _write_manifest(archive_dir, first_day, shard, {
+        "partition": name,
+        "purchases": purchases,
+        "rows": rows,
+        "purge_started": False,
+    })
+    return rows
+
+
+def purge_partition(conn: Connection, first_day: date, archive_dir: str = ARCHIVE_DIR,
+                    shard: str = MAIN) -> None:
+    """アーカイブ済みを確認してから、明細を小分けに削除 → パーティションを DROP
+
+    明細の削除を始める前にマニフェストへ purge_started を記録する。途中で止まった場合は
+    購入数（DROP までは減らない）だけを照合して、削除の続きから再開する。
+    """
+    import pyarrow.parquet as pq
+
+    name = partition_name(first_day)
+    path = _archive_path(archive_dir, first_day, shard)
+    manifest = _read_manifest(archive_dir, first_day, shard)
+    if manifest is None or not os.path.exists(path):
+        raise RuntimeError(f"{name} is not archived yet: {path}")
+    if pq.ParquetFile(path).metadata.num_rows != manifest["rows"]:
+        raise RuntimeError(f"{name}: {path} does not match its manifest; restore it from backup")
+
+    purchases, rows = _count(conn, name)
+    if manifest["purge_started"]:
+        if purchases != manifest["purchases"]:
+            raise RuntimeError(
+                f"{name}: table has {purchases} purchases but {manifest['purchases']} were archived,"
+                " and details were already being purged; reconcile by hand before dropping"
+            )
+    elif (purchases, rows) != (manifest["purchases"], manifest["rows"]):
+        raise RuntimeError(
+            f"{name}: table has {purchases} purchases / {rows} rows but the archive has"
+            f" {manifest['purchases']} / {manifest['rows']}; nothing was deleted, so remove"
+            f" {os.path.dirname(path)} and archive again"
+        )
+    else:
+        manifest["purge_started"] = True
+        _write_manifest(archive_dir, first_day, shard, manifest)
+
+    # purchase_details はパーティション化されていないので、ロックを短くするため小分けに消す
+    last = ""
+    while True:
+        ids = conn.execute(text(
+            f"SELECT purchase_id FROM {TABLE} PARTITION ({name})"
+            " WHERE purchase_id > :last ORDER BY purchase_id LIMIT :n"
+        ), {"last": last, "n": PURGE_BATCH}).scalars().all()
+        if not ids:
+            break
+        conn.execute(
+            text("DELETE FROM purchase_details WHERE purchase_id IN :ids").bindparams(
+                bindparam("ids", expanding=True)),
+            {"ids": list(ids)},
+        )
+        conn.commit()
+        last = ids[-1]
+
+    # パーティションの DROP は行単位の DELETE と違い一瞬で終わる
+    conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION {name}"))
+
+
+def archive_old(conn: Connection, keep_months: int = 12, archive_dir: str = ARCHIVE_DIR,
+                purge: bool = False, today: Optional[date] = None,
+                shard: str = MAIN) -> list[tuple[str, int]]:
+    """keep_months より古い月をアーカイブ（purge=True なら削除まで）"""
+    cutoff = month_start(today or date.today(), -keep_months)
+    done = []
+    for first_day in _monthly(conn):
+        if first_day >= cutoff:
+            break
+        n = archive_partition(conn, first_day, archive_dir, shard)
+        if purge:
+            purge_partition(conn, first_day, archive_dir, shard)
+        done.append((partition_name(first_day), n))
+    return done
+
+
+def read_archive(archive_dir: str = ARCHIVE_DIR):
+    """集計用：アーカイブ済みの購入明細を pyarrow.dataset で返す
+
+    例: read_archive().to_table(filter=ds.field("month") == "2024-04").to_pandas()
+    （shard 列も付くので、全シャード分をまとめて集計できる）
+    """
+    import pyarrow.dataset as ds
+
+    return ds.dataset(os.path.join(archive_dir, TABLE), format="parquet", partitioning="hive")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse
+
+    from .shards import get_router
+
+    parser = argparse.ArgumentParser(description="purchases partition maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    roll = sub.add_parser("roll")
+    roll.add_argument("--ahead", type=int, default=3)
+    arc = sub.add_parser("archive")
+    arc.add_argument("--keep-months", type=int, default=12)
+    arc.add_argument("--dir", default=ARCHIVE_DIR)
+    arc.add_argument("--purge", action="store_true")
+    args = parser.parse_args(argv)
+
+    # purchases は全シャードにあるので、シャードごとに同じ操作をする
+    for shard, engine in get_router().engines.items():
+        with engine.connect() as conn:
+            if args.cmd == "list":
+                for p in list_partitions(conn):
+                    print(f"{shard:>6} {p['name']:>10}  < {p['bound']:<14} ~{p['rows_est']} rows")
+            elif args.cmd == "roll":
+                print(f"{shard}: created:", roll_forward(conn, args.ahead) or "(none)")
+            else:
+                for name, n in archive_old(conn, args.keep_months, args.dir, args.purge, shard=shard):
+                    print(f"{shard} {name}: {n} rows archived{' and purged' if args.purge else ''}")
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# backend/db_control/recommend.py
+"""「一緒に買われている商品」レコメンド
+
+purchase_details を purchase_id ごとにまとめた「かご × 商品」の 0/1 行列 B から
+共起行列 C = Bᵀ·B（商品 × 商品、対角は 0）を SciPy の疎行列で計算する。
+
+- 新しい購入だけを C に足し込む（全履歴の再計算はしない）。purchase_id は挿入順に
+  並ばず（"P10" < "P9"）、日付の遡った購入も入りうるので、取り込んだ最大の purchase_date
+  から RESCAN_DAYS 日前までを毎回読み直し、取り込み済みの purchase_id を飛ばす
+  （それより古い日付で後から入った購入は取り込まれない。rebuild で作り直す）
+- 各商品の上位 K 件を配列で前計算しておき、API からはメモリ参照だけで返す
+- スナップショットは .npz（圧縮）で保存し、os.replace でアトミックに差し替える
+
+CLI::
+
+    python -m backend.db_control.recommend rebuild   # スナップショットを作り直す
+    python -m backend.db_control.recommend update    # 新しい購入だけ取り込む
+    python -m backend.db_control.recommend bench --rows 3000000 --items 5000
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+
+from .mymodels_MySQL import Purchases, PurchaseDetails
+
+SNAPSHOT_PATH = os.getenv(
+    "RECO_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reco_snapshot.npz"),
+)
+DEFAULT_TOP_K = 20
+RESCAN_DAYS = int(os.getenv("RECO_RESCAN_DAYS", "7"))
+
+
+class CooccurrenceIndex:
+    """商品 × 商品の共起回数と、商品ごとの上位 K 件"""
+
+    def __init__(self, top_k: int = DEFAULT_TOP_K):
+        self.top_k = top_k
+        self.item_ids: list[str] = []
+        self._code: dict[str, int] = {}
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.topk_idx = np.empty((0, top_k), dtype=np.int32)
+        self.topk_score = np.empty((0, top_k), dtype=np.int32)
+        self.watermark: Optional[date] = None  # 取り込んだ購入の最大 purchase_date
+        # watermark - RESCAN_DAYS 以降に取り込んだ購入（読み直したときの重複除外用）
+        self.recent: dict[str, date] = {}
+
+    # ---- 構築 / 差分更新 ----
+    def _encode_items(self, item_keys: np.ndarray) -> np.ndarray:
+        uniq, inverse = np.unique(item_keys, return_inverse=True)
+        codes = np.empty(len(uniq), dtype=np.int32)
+        for i, key in enumerate(uniq.tolist()):
+            code = self._code.get(key)
+            if code is None:
+                code = len(self.item_ids)
+                self._code[key] = code
+                self.item_ids.append(key)
+            codes[i] = code
+        return codes[inverse]
+
+    def add_baskets(self, purchase_keys: Iterable, item_keys: Iterable) -> int:
+        """(purchase_id, item_id) のペア配列を取り込む。取り込んだかご数を返す"""
+        purchase_keys = np.asarray(purchase_keys)
+        item_keys = np.asarray(item_keys)
+        if purchase_keys.size == 0:
+            return 0
+
+        _, p_codes = np.unique(purchase_keys, return_inverse=True)
+        i_codes = self._encode_items(item_keys)
+        n_items = len(self.item_ids)
+        n_baskets = int(p_codes.max()) + 1
+
+        basket = sparse.csr_matrix(
+            (np.ones(len(i_codes), dtype=np.int32), (p_codes, i_codes)),
+            shape=(n_baskets, n_items),
+        )
+        basket.data[:] = 1  # 同じかごに同じ商品が複数行あっても 1 回と数える
+
+        delta = (basket.T @ basket).tocsr()
+        delta = (delta - sparse.diags(delta.diagonal())).tocsr()  # 対角（自分自身）を落とす
+        delta.eliminate_zeros()
+
+        if self.matrix.shape[0] != n_items:
+            self.matrix = _resize(self.matrix, n_items)
+            self._grow_topk(n_items)
+        self.matrix = (self.matrix + delta).tocsr()
+
+        # 共起が増えた商品（delta の非ゼロ行）だけ上位 K を作り直す
+        self._update_topk(np.flatnonzero(np.diff(delta.indptr)))
+        return n_baskets
+
+    def _grow_topk(self, n_items: int) -> None:
+        extra = n_items - self.topk_idx.shape[0]
+        self.topk_idx = np.vstack([self.topk_idx, np.full((extra, self.top_k), -1, dtype=np.int32)])
+        self.topk_score = np.vstack([self.topk_score, np.zeros((extra, self.top_k), dtype=np.int32)])
+
+    def _update_topk(self, rows: np.ndarray) -> None:
+        m = self.matrix
+        k = self.top_k
+        for r in rows.tolist():
+            start, end = m.indptr[r], m.indptr[r + 1]
+            cols = m.indices[start:end]
+            vals = m.data[start:end]
+            if len(vals) > k:
+                part = np.argpartition(-vals, k)[:k]
+                cols, vals = cols[part], vals[part]
+            order = np.lexsort((cols, -vals))  # 回数の降順、同数なら番号順
+            n = len(order)
+            self.topk_idx[r, :n] = cols[order]
+            self.topk_idx[r, n:] = -1
+            self.topk_score[r, :n] = vals[order]
+            self.topk_score[r, n:] = 0
+
+    # ---- 参照 ----
+    def related(self, item_id: str, k: int = 10) -> list[dict]:
+        code = self._code.get(item_id)
+        if code is None:
+            return []
+        idx = self.topk_idx[code, :k]
+        score = self.topk_score[code, :k]
+        ids = self.item_ids
+        return [
+            {"item_id": ids[i], "count": int(s)}
+            for i, s in zip(idx.tolist(), score.tolist())
+            if i >= 0
+        ]
+
+    # ---- スナップショット ----
+    def save(self, path: str = SNAPSHOT_PATH) -> None:
+        m = self.matrix
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp,
+            item_ids=np.array(self.item_ids, dtype=str),
+            data=m.data, indices=m.indices, indptr=m.indptr,
+            topk_idx=self.topk_idx, topk_score=self.topk_score,
+            watermark=np.array(self.watermark.isoformat() if self.watermark else "", dtype=str),
+            recent_ids=np.array(list(self.recent), dtype=str),
+            recent_dates=np.array([d.isoformat() for d in self.recent.values()], dtype=str),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str = SNAPSHOT_PATH) -> "CooccurrenceIndex":
+        with np.load(path) as z:
+            idx = cls(top_k=z["topk_idx"].shape[1])
+            idx.item_ids = z["item_ids"].tolist()
+            idx._code = {key: i for i, key in enumerate(idx.item_ids)}
+            n = len(idx.item_ids)
+            idx.matrix = sparse.csr_matrix((z["data"], z["indices"], z["indptr"]), shape=(n, n))
+            idx.topk_idx = z["topk_idx"]
+            idx.topk_score = z["topk_score"]
+            wm = str(z["watermark"])
+            idx.watermark = date.fromisoformat(wm) if wm else None
+            idx.recent = {pid: date.fromisoformat(d)
+                          for pid, d in zip(z["recent_ids"].tolist(), z["recent_dates"].tolist())}
+        return idx
+
+
+def _resize(m: sparse.csr_matrix, n: int) -> sparse.csr_matrix:
+    """正方行列を n × n に広げる（新しい商品の追加）"""
+    indptr = np.concatenate([m.indptr, np.full(n - m.shape[0], m.indptr[-1], dtype=m.indptr.dtype)])
+    return sparse.csr_matrix((m.data, m.indices, indptr), shape=(n, n))
+
+
+# ===== DB からの取り込み =====
+def update_from_db(session, index: CooccurrenceIndex, chunk_rows: int = 200_000,
+                   on_chunk: Optional[Callable[[int], None]] = None,
+                   rescan_days: int = RESCAN_DAYS) -> int:
+    """前回までに取り込んでいない購入を取り込む。取り込んだかご数を返す
+
+    on_chunk はチャンクごとに累計かご数で呼ばれる（進捗報告・キャンセル確認用）。
+    """
+    since = _rescan_from(index, rescan_days)
+    total = _scan(session, index, since, chunk_rows, on_chunk)
+    _prune(index, rescan_days)
+    return total
+
+
+def update_from_router(router, index: CooccurrenceIndex, chunk_rows: int = 200_000,
+                       on_chunk: Optional[Callable[[int], None]] = None,
+                       rescan_days: int = RESCAN_DAYS) -> int:
+    """全シャードの購入を取り込む（購入は customer_id でシャードに分かれている）
+
+    読み直しの起点は最初に 1 回だけ決める。シャードごとに決めると、先のシャードで
+    watermark が進んだぶん後のシャードの購入を読み飛ばすため。
+    """
+    since = _rescan_from(index, rescan_days)
+    total = 0
+    for name in router.names:
+        with router.session(name) as session:
+            total = _scan(session, index, since, chunk_rows, on_chunk, total)
+    _prune(index, rescan_days)
+    return total
+
+
+def _rescan_from(index: CooccurrenceIndex, rescan_days: int) -> Optional[date]:
+    return index.watermark - timedelta(days=rescan_days) if index.watermark else None
+
+
+def _prune(index: CooccurrenceIndex, rescan_days: int) -> None:
+    since = _rescan_from(index, rescan_days)
+    if since is not None:
+        index.recent = {pid: d for pid, d in index.recent.items() if d >= since}
+
+
+def _scan(session, index: CooccurrenceIndex, since: Optional[date], chunk_rows: int,
+          on_chunk: Optional[Callable[[int], None]], total: int = 0) -> int:
+    """since 以降の購入を読み、未取り込みのものだけを add_baskets に渡す
+
+    購入はかご単位で取り込む必要があるので、チャンク末尾の購入は次のチャンクへ持ち越す。
+    """
+    stmt = (
+        select(Purchases.purchase_date, Purchases.purchase_id, PurchaseDetails.item_id)
+        .join(PurchaseDetails, PurchaseDetails.purchase_id == Purchases.purchase_id)
+        .order_by(Purchases.purchase_date, Purchases.purchase_id)
+    )
+    if since is not None:
+        stmt = stmt.where(Purchases.purchase_date >= since)
+
+    carry: list[tuple] = []
+    result = session.execute(stmt.execution_options(yield_per=chunk_rows))
+    for chunk in result.partitions():
+        rows = carry + [tuple(r) for r in chunk if r[1] not in index.recent]
+        if not rows:
+            continue
+        last_pid = rows[-1][1]
+        cut = len(rows)
+        while cut > 0 and rows[cut - 1][1] == last_pid:
+            cut -= 1
+        ready, carry = rows[:cut], rows[cut:]
+        total += _ingest(index, ready)
+        if on_chunk is not None:
+            on_chunk(total)
+    total += _ingest(index, carry)
+    return total
+
+
+def _ingest(index: CooccurrenceIndex, rows: list[tuple]) -> int:
+    if not rows:
+        return 0
+    n = index.add_baskets([r[1] for r in rows], [r[2] for r in rows])
+    for purchase_date, purchase_id, _ in rows:
+        index.recent[purchase_id] = purchase_date
+    newest = rows[-1][0]
+    if index.watermark is None or newest > index.watermark:
+        index.watermark = newest
+    return n
+
+
+# ===== API から使う常駐インデックス =====
+_lock = threading.Lock()
+_loaded: Optional[CooccurrenceIndex] = None
+_loaded_mtime: Optional[float] = None
+
+
+def get_index(path: str = SNAPSHOT_PATH) -> Optional[CooccurrenceIndex]:
+    """スナップショットを読み込んで保持する（ファイルが更新されたら読み直す）"""
+    global _loaded, _loaded_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return _loaded
+    if mtime != _loaded_mtime:
+        with _lock:
+            if mtime != _loaded_mtime:
+                _loaded = CooccurrenceIndex.load(path)
+                _loaded_mtime = mtime
+    return _loaded
+
+
+# ===== CLI =====
+def _bench(rows: int, items: int, basket_size: int = 4) -> None:
+    rng = np.random.default_rng(0)
+    n_baskets = rows // basket_size
+    purchase_keys = np.repeat(np.arange(n_baskets), basket_size)
+    # 人気の偏りを持たせる（Zipf 風）
+    item_keys = np.char.add("I", (rng.zipf(1.3, size=rows) % items).astype(str))
+
+    index = CooccurrenceIndex()
+    t0 = time.perf_counter()
+    index.add_baskets(purchase_keys, item_keys)
+    t1 = time.perf_counter()
+    print(f"build: {rows:,} rows / {len(index.item_ids):,} items / nnz={index.matrix.nnz:,} "
+          f"in {t1 - t0:.2f}s")
+
+    # 1% の差分取り込み
+    extra = rows // 100
+    t0 = time.perf_counter()
+    index.add_baskets(purchase_keys[:extra] + n_baskets, item_keys[:extra])
+    print(f"incremental: {extra:,} rows in {time.perf_counter() - t0:.3f}s")
+
+    probes = rng.choice(index.item_ids, size=10_000)
+    t0 = time.perf_counter()
+    for item_id in probes.tolist():
+        index.related(item_id, 10)
+    per = (time.perf_counter() - t0) / len(probes)
+    print(f"lookup: {per * 1e6:.1f} µs / call")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="frequently-bought-together index")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild")
+    sub.add_parser("update")
+    bench = sub.add_parser("bench")
+    bench.add_argument("--rows", type=int, default=1_000_000)
+    bench.add_argument("--items", type=int, default=5_000)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "bench":
+        _bench(args.rows, args.items)
+        return
+
+    from .shards import get_router
+
+    if args.cmd == "update" and os.path.exists(SNAPSHOT_PATH):
+        index = CooccurrenceIndex.load(SNAPSHOT_PATH)
+    else:
+        index = CooccurrenceIndex()
+    t0 = time.perf_counter()
+    n = update_from_router(get_router(), index)
+    index.save(SNAPSHOT_PATH)
+    print(f"{args.cmd}: {n} purchases in {time.perf_counter() - t0:.2f}s -> {SNAPSHOT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
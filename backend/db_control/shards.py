@@ -0,0 +1,318 @@
+# backend/db_control/shards.py
+"""customer_id による水平シャーディング
+
+- customers / purchases / purchase_details は customer_id のコンシステントハッシュで
+  持ち主シャードに置く（仮想ノード付きのハッシュリング）
+- items / sample などのグローバル表は main（= session.engine）に置き、items は
+  明細の JOIN 用に全シャードへ複製する（sync_reference_tables）
+- 全件系の読み込みは全シャードに並列で投げ、各シャードのソート済み結果をマージする
+
+設定（環境変数）::
+
+    DB_SHARD_URLS="s1=mysql+pymysql://...,s2=mysql+pymysql://..."
+
+main シャードは常に session._db_url() の DB。未設定なら main だけの 1 シャード構成で、
+これまでと同じ動きになる。
+
+CLI::
+
+    python -m backend.db_control.shards plan    --new "s1=...,s2=...,s3=..."
+    python -m backend.db_control.shards reshard --new "s1=...,s2=...,s3=..."
+    python -m backend.db_control.shards sync-items
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from sqlalchemy import MetaData, Table, create_engine, delete, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .mymodels_MySQL import Customers, Purchases, PurchaseDetails
+
+MAIN = "main"
+VNODES = 128
+# 顧客単位でシャードに置く表（それ以外は main）
+SHARDED_TABLES = {"customers", "purchases", "purchase_details"}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """仮想ノード付きコンシステントハッシュ（シャード追加時に動くキーは約 1/N）"""
+
+    def __init__(self, names: Iterable[str], vnodes: int = VNODES):
+        points = sorted((_hash(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._names = [n for _, n in points]
+
+    def owner(self, key: str) -> str:
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._names[i]
+
+
+class ShardRouter:
+    def __init__(self, engines: Dict[str, Engine], vnodes: int = VNODES):
+        if MAIN not in engines:
+            raise ValueError(f"shard '{MAIN}' is required (it holds the global tables)")
+        self.engines = dict(engines)
+        self.ring = HashRing(self.engines, vnodes)
+        self._sessions = {
+            name: sessionmaker(bind=eng, autocommit=False, autoflush=False)
+            for name, eng in self.engines.items()
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(engines)), thread_name_prefix="shard")
+
+    @classmethod
+    def from_urls(cls, urls: Dict[str, str], **engine_kwargs) -> "ShardRouter":
+        return cls({name: create_engine(url, **engine_kwargs) for name, url in urls.items()})
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.engines)
+
+    def shard_for(self, customer_id: str) -> str:
+        return self.ring.owner(str(customer_id))
+
+    def engine_for(self, customer_id: str) -> Engine:
+        return self.engines[self.shard_for(customer_id)]
+
+    def session_for(self, customer_id: str) -> Session:
+        return self._sessions[self.shard_for(customer_id)]()
+
+    def session(self, name: str = MAIN) -> Session:
+        return self._sessions[name]()
+
+    def fan_out(self, fn: Callable[[Session], list], key: Optional[Callable[[Any], Any]] = None,
+                limit: Optional[int] = None) -> list:
+        """fn を全シャードで並列実行。key があればソート済み結果としてマージする"""
+
+        def run(name: str) -> list:
+            with self._sessions[name]() as s:
+                return list(fn(s))
+
+        results = list(self._pool.map(run, self.names))
+        merged = heapq.merge(*results, key=key) if key else (r for rows in results for r in rows)
+        if limit is not None:
+            return [r for _, r in zip(range(limit), merged)]
+        return list(merged)
+
+
+# ===== 既定のルーター（アプリ / crud から使う） =====
+_router: Optional[ShardRouter] = None
+_router_lock = threading.Lock()
+
+
+def parse_shard_urls(spec: str) -> Dict[str, str]:
+    """"s1=url1,s2=url2" → {"s1": url1, "s2": url2}"""
+    urls = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, url = part.partition("=")
+        if not url or name == MAIN:
+            raise ValueError(f"invalid shard spec: {part!r}")
+        urls[name.strip()] = url.strip()
+    return urls
+
+
+def get_router() -> ShardRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                from .session import engine, connect_args
+
+                engines = {MAIN: engine}
+                for name, url in parse_shard_urls(os.getenv("DB_SHARD_URLS", "")).items():
+                    engines[name] = create_engine(
+                        url, pool_pre_ping=True, pool_recycle=1800, pool_size=5, max_overflow=5,
+                        connect_args=connect_args if url.startswith("mysql") else {},
+                    )
+                _router = ShardRouter(engines)
+    return _router
+
+
+def set_router(router: Optional[ShardRouter]) -> None:
+    """テストやツールからルーターを差し替える"""
+    global _router
+    _router = router
+
+
+def get_customer_db(customer_id: str):
+    """FastAPI 依存性：customer_id（パス / クエリ）の持ち主シャードのセッション"""
+    db = get_router().session_for(customer_id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ===== 参照表の複製 =====
+def _reflect(session: Session, name: str) -> Table:
+    # ORM モデルは列の一部しか持たない（id / created_at など）ので、実際の表の定義を読む
+    return Table(name, MetaData(), autoload_with=session.connection())
+
+
+def sync_reference_tables(router: ShardRouter) -> None:
+    """items を main から他のシャードへ複製する（明細との JOIN 用。小さい表なので全件入れ替え）
+
+    ORM のモデルではなく DB の表定義から列を取るので、id / created_at / version も含めて
+    両方にある列はすべて複製する。
+    """
+    with router.session(MAIN) as src:
+        items = _reflect(src, "items")
+        rows = [dict(r) for r in src.execute(select(items)).mappings()]
+    for name in router.names:
+        if name == MAIN:
+            continue
+        with router.session(name) as dst:
+            table = _reflect(dst, "items")
+            cols = [c for c in items.c.keys() if c in table.c]
+            pk = table.c.item_id
+            existing = set(dst.execute(select(pk)).scalars())
+            keep = {r["item_id"] for r in rows}
+            gone = existing - keep
+            if gone:
+                dst.execute(delete(table).where(pk.in_(gone)))
+            for r in rows:
+                values = {c: r[c] for c in cols}
+                if r["item_id"] in existing:
+                    dst.execute(table.update().where(pk == r["item_id"]).values(**values))
+                else:
+                    dst.execute(insert(table).values(**values))
+            dst.commit()
+
+
+# ===== リシャーディング =====
+def plan(old: ShardRouter, new: ShardRouter) -> Dict[tuple[str, str], int]:
+    """(移動元, 移動先) ごとの顧客数"""
+    moves: Dict[tuple[str, str], int] = {}
+    for name in old.names:
+        with old.session(name) as s:
+            for cid in s.execute(select(Customers.customer_id)).scalars():
+                dst = new.shard_for(cid)
+                if dst != name:
+                    moves[(name, dst)] = moves.get((name, dst), 0) + 1
+    return moves
+
+
+def _copy_rows(src: Session, dst: Session, table, where) -> list[dict]:
+    rows = [dict(r) for r in src.execute(select(table).where(where)).mappings()]
+    if rows:
+        dst.execute(insert(table), rows)
+    return rows
+
+
+def reshard(old: ShardRouter, new: ShardRouter, batch: int = 500,
+            log: Callable[[str], None] = print) -> int:
+    """new のリングで持ち主が変わる顧客を、購入・明細ごと移動する。移動した顧客数を返す
+
+    顧客単位で「移動先にコピーしてコミット → 移動元から削除してコミット」（_move_customer）。
+    途中で止まっても再実行すればよい。
+
+    運用手順：先に新しいシャードのスキーマを作る（DB_SHARD_URLS=<新しい構成> alembic upgrade head、
+    migrations/README）。アプリは古い構成のまま動かしてよい（移動中の顧客への書き込みは行ロックで
+    待たされ、移動後に古い構成で届いた書き込みは失敗する）。終わったら DB_SHARD_URLS を
+    新しい構成に切り替え、同じ --new でもう一度 reshard を流して、移動中に古い構成で
+    作られた顧客を拾う。
+    """
+    moved = 0
+    for name in old.names:
+        last = ""
+        while True:
+            with old.session(name) as src:
+                ids = src.execute(
+                    select(Customers.customer_id).where(Customers.customer_id > last)
+                    .order_by(Customers.customer_id).limit(batch)
+                ).scalars().all()
+            if not ids:
+                break
+            last = ids[-1]
+            for cid in ids:
+                dst_name = new.shard_for(cid)
+                if dst_name == name:
+                    continue
+                _move_customer(old.session(name), new.session(dst_name), cid)
+                moved += 1
+            log(f"[reshard] {name}: scanned up to {last}, moved {moved}")
+    return moved
+
+
+def _move_customer(src: Session, dst: Session, customer_id: str) -> None:
+    """1 顧客を購入・明細ごと移す
+
+    移動元の customers 行を FOR UPDATE で押さえたまま「コピー → 移動先コミット →
+    移動元削除 → コミット」まで行う。その間、customers の更新・削除と、crud 経由の
+    購入・明細の追加（customers 行を FOR SHARE で読む）は待たされるので、コピーの後に
+    書かれて消える行は無い。移動後に古いリングで届いた書き込みは、移動元に customers 行が
+    無いので 404 / customer_not_found になる（黙って消えない）。
+    """
+    with src, dst:
+        locked = src.execute(
+            select(Customers.customer_id).where(Customers.customer_id == customer_id)
+            .with_for_update()
+        ).first()
+        if locked is None:
+            return  # 既に移動済み / 削除済み
+        purchase_ids = src.execute(
+            select(Purchases.purchase_id).where(Purchases.customer_id == customer_id)
+        ).scalars().all()
+
+        # 前回の途中で残ったコピーは、その後の書き込みを含んでいないかもしれないので作り直す
+        old_ids = dst.execute(
+            select(Purchases.purchase_id).where(Purchases.customer_id == customer_id)
+        ).scalars().all()
+        _delete_customer(dst, customer_id, old_ids)
+        _copy_rows(src, dst, Customers.__table__, Customers.customer_id == customer_id)
+        _copy_rows(src, dst, Purchases.__table__, Purchases.customer_id == customer_id)
+        if purchase_ids:
+            _copy_rows(src, dst, PurchaseDetails.__table__,
+                       PurchaseDetails.purchase_id.in_(purchase_ids))
+        dst.commit()
+
+        _delete_customer(src, customer_id, purchase_ids)
+        src.commit()
+
+
+def _delete_customer(session: Session, customer_id: str, purchase_ids: list) -> None:
+    # 子から順に消す（FK / トリガーの有無に依存しない）
+    if purchase_ids:
+        session.execute(delete(PurchaseDetails).where(PurchaseDetails.purchase_id.in_(purchase_ids)))
+    session.execute(delete(Purchases).where(Purchases.customer_id == customer_id))
+    session.execute(delete(Customers).where(Customers.customer_id == customer_id))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="customer shard tools")
+    parser.add_argument("cmd", choices=["plan", "reshard", "sync-items"])
+    parser.add_argument("--new", default="", help='新しい構成の追加シャード "s1=url,s2=url"（main は共通）')
+    args = parser.parse_args(argv)
+
+    old = get_router()
+    if args.cmd == "sync-items":
+        sync_reference_tables(old)
+        return
+
+    engines = {MAIN: old.engines[MAIN]}
+    for name, url in parse_shard_urls(args.new).items():
+        engines[name] = old.engines.get(name) or create_engine(url, pool_pre_ping=True)
+    new = ShardRouter(engines)
+    if args.cmd == "plan":
+        for (src, dst), n in sorted(plan(old, new).items()):
+            print(f"{src} -> {dst}: {n} customers")
+    else:
+        sync_reference_tables(new)
+        print(f"moved {reshard(old, new)} customers; now set DB_SHARD_URLS={args.new!r}")
+
+
+if __name__ == "__main__":
+    main()
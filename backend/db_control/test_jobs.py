@@ -0,0 +1,90 @@
+# backend/db_control/test_jobs.py
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from db_control import jobs
+from db_control.models import Base, Jobs
+# ↑ backend ディレクトリで `python -m db_control.test_jobs`（ローカルの SQLite ファイルで完結）
+
+_lock = threading.Lock()
+_active = 0
+_peak = 0
+
+
+@jobs.job("test_sleep", concurrency=1)
+def sleep_job(ctx, seconds: float = 0.0) -> dict:
+    # ctx.report() を呼ばない長いジョブ（ハートビートはランナーが打つ）
+    global _active, _peak
+    with _lock:
+        _active += 1
+        _peak = max(_peak, _active)
+    try:
+        time.sleep(seconds)
+    finally:
+        with _lock:
+            _active -= 1
+    return {"slept": seconds}
+
+
+@jobs.job("test_sleep_wide", concurrency=2)
+def sleep_wide_job(ctx, seconds: float = 0.0) -> dict:
+    time.sleep(seconds)
+    return {"slept": seconds}
+
+
+def _wait(db_factory, job_ids, statuses, timeout: float = 15.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        with db_factory() as db:
+            rows = dict(db.execute(
+                select(Jobs.job_id, Jobs.status).where(Jobs.job_id.in_(job_ids))
+            ).all())
+        if all(s in statuses for s in rows.values()) or time.monotonic() > deadline:
+            return rows
+        time.sleep(0.1)
+
+
+def run():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'jobs.db')}")
+        Base.metadata.create_all(engine)
+        factory = sessionmaker(bind=engine)
+        jobs._session = factory  # ランナーとジョブの DB を SQLite に向ける
+
+        # 1) 進捗報告の無い 1.5 秒のジョブも、stale_after=1 で「runner lost」にならない
+        # 2) ランナーが 2 つあっても concurrency=1 は全体で守られる
+        runners = [jobs.JobRunner(process_workers=1, poll_interval=0.05,
+                                  heartbeat_interval=0.2, stale_after=1.0) for _ in range(2)]
+        for r in runners:
+            r.start()
+        with factory() as db:
+            ids = [jobs.submit(db, "test_sleep", {"seconds": 1.5}).job_id for _ in range(2)]
+        done = _wait(factory, ids, jobs.FINISHED)
+        assert set(done.values()) == {"succeeded"}, done
+        assert _peak == 1, _peak
+
+        # 3) 停止時にまだ始まっていないジョブは failed ではなく queued に戻る
+        for r in runners:
+            r.stop()
+        runner = jobs.JobRunner(process_workers=1, thread_workers=1, poll_interval=0.05,
+                                heartbeat_interval=0.2, stale_after=1.0)
+        with factory() as db:
+            ids = [jobs.submit(db, "test_sleep_wide", {"seconds": 1.0}).job_id for _ in range(2)]
+        runner.start()
+        _wait(factory, ids, ("running",))  # 2 件とも取得済み（スレッドは 1 本なので 1 件は待ち）
+        runner.stop(wait=False)
+        done = _wait(factory, ids, ("succeeded", "queued"))
+        assert sorted(done.values()) == ["queued", "succeeded"], done
+
+        engine.dispose()
+
+    print("jobs: OK")
+
+
+if __name__ == "__main__":
+    run()
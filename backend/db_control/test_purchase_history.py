@@ -0,0 +1,64 @@
+# backend/db_control/test_purchase_history.py
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from db_control.history import QUERIES_PER_PAGE, fetch_purchase_history
+from db_control.mymodels_MySQL import Base, Customers, Items, Purchases, PurchaseDetails
+# ↑ backend ディレクトリで `python -m db_control.test_purchase_history`（SQLite メモリDBで完結）
+
+
+def _seed(session: Session, n_purchases: int, n_details: int) -> None:
+    session.add(Customers(customer_id="C001", customer_name="履歴太郎", age=30, gender="M"))
+    for i in range(n_details):
+        session.add(Items(item_id=f"I{i:03d}", item_name=f"商品{i}", price=100 + i))
+    start = date(2025, 1, 1)
+    for p in range(n_purchases):
+        pid = f"P{p:04d}"
+        # 同じ日付の購入を混ぜてキーセットの同値処理も確認する
+        session.add(Purchases(purchase_id=pid, customer_id="C001",
+                              purchase_date=start + timedelta(days=p // 2)))
+        for d in range(n_details):
+            session.add(PurchaseDetails(detail_id=f"D{p:04d}{d:02d}", purchase_id=pid,
+                                        item_id=f"I{d:03d}", quantity=d + 1))
+    session.commit()
+
+
+def run():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cur, stmt, params, ctx, many: statements.append(stmt))
+
+    with Session(engine) as session:
+        _seed(session, n_purchases=45, n_details=5)
+
+    seen = []
+    before_date = before_id = None
+    with Session(engine) as session:
+        while True:
+            statements.clear()
+            page = fetch_purchase_history(session, "C001", 20, before_date, before_id)
+            # 購入・明細の件数によらずクエリ数は固定
+            assert len(statements) == QUERIES_PER_PAGE, statements
+            for p in page["purchases"]:
+                assert len(p["details"]) == 5
+                expected = sum((100 + d) * (d + 1) for d in range(5))
+                assert float(p["total"]) == expected, p
+            seen += [p["purchase_id"] for p in page["purchases"]]
+            if page["next"] is None:
+                break
+            before_date = page["next"]["before_date"]
+            before_id = page["next"]["before_id"]
+
+        assert seen == [f"P{p:04d}" for p in reversed(range(45))], seen
+        assert fetch_purchase_history(session, "NOPE") is None
+
+    print("purchase history: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,77 @@
+# backend/db_control/test_recommend.py
+import os
+import tempfile
+import warnings
+from datetime import date
+
+import numpy as np
+from scipy.sparse import SparseEfficiencyWarning
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from db_control.mymodels_MySQL import Base, Customers, Items, Purchases, PurchaseDetails
+from db_control.recommend import CooccurrenceIndex, update_from_db
+# ↑ backend ディレクトリで `python -m db_control.test_recommend`（SQLite メモリDBで完結）
+
+
+def _buy(session: Session, pid: str, day: date, items: list) -> None:
+    session.add(Purchases(purchase_id=pid, customer_id="C001", purchase_date=day))
+    for i, item_id in enumerate(items):
+        session.add(PurchaseDetails(detail_id=f"D{pid[1:]}{i}", purchase_id=pid,
+                                    item_id=item_id, quantity=1))
+    session.commit()
+
+
+def _dense(index: CooccurrenceIndex) -> dict:
+    m = index.matrix.toarray()
+    ids = index.item_ids
+    return {(ids[r], ids[c]): int(m[r, c]) for r, c in zip(*np.nonzero(m))}
+
+
+def run():
+    warnings.simplefilter("error", SparseEfficiencyWarning)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.add(Customers(customer_id="C001", customer_name="共起太郎", age=30, gender="M"))
+        for i in range(6):
+            session.add(Items(item_id=f"I{i}", item_name=f"商品{i}", price=100))
+        session.commit()
+
+        _buy(session, "P1", date(2025, 3, 1), ["I0", "I1"])
+        _buy(session, "P9", date(2025, 3, 5), ["I0", "I1", "I2"])
+        incremental = CooccurrenceIndex()
+        assert update_from_db(session, incremental) == 2
+        assert incremental.watermark == date(2025, 3, 5)
+
+        # 1) 同じ日付で ID が辞書順で前に来る購入（"P10" < "P9"）と、日付の遡った購入
+        _buy(session, "P10", date(2025, 3, 5), ["I3", "I4"])
+        _buy(session, "P11", date(2025, 3, 2), ["I4", "I5"])
+        assert update_from_db(session, incremental) == 2
+
+        # 2) もう一度回しても二重に数えない
+        assert update_from_db(session, incremental, chunk_rows=1) == 0
+
+        # 3) 差分取り込みの結果が全件構築と一致する
+        full = CooccurrenceIndex()
+        assert update_from_db(session, full, chunk_rows=3) == 4
+        assert _dense(incremental) == _dense(full)
+        assert all(a != b for a, b in _dense(full)), "diagonal must be empty"
+        assert incremental.related("I4") == full.related("I4")
+        assert {r["item_id"] for r in full.related("I4")} == {"I3", "I5"}
+
+        # 4) スナップショットを挟んでも重複除外が引き継がれる
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "reco.npz")
+            incremental.save(path)
+            loaded = CooccurrenceIndex.load(path)
+        assert loaded.watermark == incremental.watermark and loaded.recent == incremental.recent
+        assert update_from_db(session, loaded) == 0
+        assert _dense(loaded) == _dense(full)
+
+    print("recommend: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,108 @@
+# backend/db_control/test_shards.py
+import json
+import os
+import tempfile
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import create_engine, func, select
+
+from db_control import crud
+from db_control.mymodels_MySQL import Base, Customers, Items, Purchases, PurchaseDetails
+from db_control.models import CatalogState
+from db_control.recommend import CooccurrenceIndex, update_from_router
+from db_control.shards import MAIN, ShardRouter, reshard, set_router, sync_reference_tables
+# ↑ backend ディレクトリで `python -m db_control.test_shards`（ローカルの SQLite ファイル複数で完結）
+
+
+def _router(tmpdir: str, names: list) -> ShardRouter:
+    engines = {}
+    for name in names:
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir, name + '.db')}")
+        Base.metadata.create_all(engine)
+        CatalogState.__table__.create(engine)
+        engines[name] = engine
+    return ShardRouter(engines)
+
+
+def _count(router: ShardRouter, model) -> Counter:
+    counts = Counter()
+    for name in router.names:
+        with router.session(name) as s:
+            counts[name] = s.execute(select(func.count()).select_from(model)).scalar_one()
+    return counts
+
+
+def run():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        router = _router(tmpdir, [MAIN, "s1", "s2"])
+        set_router(router)
+
+        # 1) crud 経由の書き込みは customer_id の持ち主シャードへ
+        crud.myinsert(Items, {"item_id": "I001", "item_name": "りんご", "price": 100})
+        with router.session(MAIN) as s:
+            assert s.get(CatalogState, 1).version == 1  # items の書き込みでカタログの版が進む
+        ids = [f"C{i:04d}" for i in range(300)]
+        for cid in ids:
+            assert crud.myinsert(Customers, {
+                "customer_id": cid, "customer_name": f"顧客{cid}", "age": 20, "gender": "M",
+            }) == f"inserted:{cid}"
+            crud.myinsert(Purchases, {"purchase_id": f"P{cid[1:]}", "customer_id": cid,
+                                      "purchase_date": date(2025, 1, 1)})
+            crud.myinsert(PurchaseDetails, {"detail_id": f"D{cid[1:]}", "purchase_id": f"P{cid[1:]}",
+                                            "item_id": "I001", "quantity": 1}, customer_id=cid)
+        sync_reference_tables(router)
+
+        counts = _count(router, Customers)
+        assert sum(counts.values()) == 300 and all(counts[n] > 0 for n in router.names), counts
+        for cid in ids[:20]:
+            with router.session_for(cid) as s:
+                assert s.get(Customers, cid) is not None
+
+        # 2) 全件取得は全シャードから PK 順にマージ
+        rows = json.loads(crud.myselectAll(Customers, fields="customer_id,customer_name"))
+        assert [r["customer_id"] for r in rows] == ids
+
+        # 3) 1件取得・更新・削除も持ち主シャードに届く
+        assert json.loads(crud.myselect(Customers, "C0042"))[0]["customer_name"] == "顧客C0042"
+        assert crud.myupdate(Customers, {"customer_id": "C0042", "age": 30}, expected_version=1) == "updated"
+        assert crud.myupdate(Customers, {"customer_id": "C0042", "age": 31}, expected_version=1) == "conflict"
+        assert crud.mydelete(Customers, "NOPE") == "not_found"
+        assert crud.myinsert(Purchases, {"purchase_id": "PX", "customer_id": "NOPE",
+                                         "purchase_date": date(2025, 1, 1)}) == "customer_not_found"
+
+        # 4) シャードを 1 つ足してリシャーディング：持ち主の変わった顧客だけが動く
+        new = _router(tmpdir, [MAIN, "s1", "s2", "s3"])
+        sync_reference_tables(new)
+        moved = reshard(router, new, batch=50, log=lambda msg: None)
+        assert 0 < moved < 300, moved
+        assert sum(_count(new, Customers).values()) == 300
+        assert sum(_count(new, PurchaseDetails).values()) == 300
+        for cid in ids:
+            with new.session_for(cid) as s:
+                assert s.get(Customers, cid) is not None, cid
+                assert s.execute(select(Purchases).where(Purchases.customer_id == cid)).first()
+
+        # 5) 移動後に古いリングで届いた書き込みは、黙って移動元に残らずに失敗する
+        cid = next(c for c in ids if router.shard_for(c) != new.shard_for(c))
+        assert crud.myinsert(Purchases, {"purchase_id": "PLATE", "customer_id": cid,
+                                         "purchase_date": date(2025, 2, 1)}) == "customer_not_found"
+        assert crud.myupdate(Customers, {"customer_id": cid, "age": 40}) == "not_found"
+
+        # 6) 再実行しても何も動かない
+        assert reshard(new, new, log=lambda msg: None) == 0
+
+        # 7) 全シャードの購入を読む処理（レコメンド）は main 以外のシャードも見る
+        index = CooccurrenceIndex()
+        assert update_from_router(new, index) == 300
+
+        set_router(None)
+        for r in (router, new):
+            for engine in r.engines.values():
+                engine.dispose()
+
+    print(f"shards: OK ({moved} of 300 customers moved)")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,267 @@
+# backend/migrations/backfill.py
+"""マイグレーション用のバッチ・バックフィル
+
+大きなテーブルに新しい列を追加したあと、1 本の UPDATE で埋めるとテーブルロックと
+レプリケーション遅延が発生する。ここでは主キー順のチャンクで少しずつ埋め、
+進捗を backfill_checkpoints に記録して途中から再開できるようにする。
+
+使い方（列追加のリビジョンとは分けて、バックフィル専用のリビジョンを作る）::
+
+    from backend.migrations.backfill import Backfill, run_backfill
+
+    def upgrade() -> None:
+        run_backfill(Backfill(
+            name="items_price_cents",
+            table="items",
+            pk="item_id",
+            set_sql="price_cents = ROUND(price * 100)",
+            pending_sql="price_cents IS NULL",
+        ))
+
+- ``pending_sql`` は「まだ埋まっていない行」の条件。UPDATE が冪等になるので、
+  途中で落ちても同じチャンクをやり直して問題ない
+- ``alembic -x backfill_dry_run=1 upgrade head`` で件数とチャンク数の見積もりだけ出す
+  （見積もり後に BackfillDryRun で中断するので、リビジョンは適用済みにならない）。
+  中断するのは最初にバックフィルを呼んだリビジョンなので、見積もられるのはそのリビジョン
+  の分だけ。後続のバックフィル・リビジョンは、前のリビジョンを適用してから改めて dry-run する
+- マイグレーションの接続は primary なので、レプリカ遅延はそのままでは測れない。
+  ``-x backfill_replica_url=mysql+pymysql://...``（または環境変数 BACKFILL_REPLICA_URL）で
+  レプリカを指定すると、チャンクごとにそちらの遅延を見て待つ。指定が無ければ
+  バッチサイズの調整（UPDATE の所要時間）だけで抑える
+"""
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+
+CHECKPOINT_TABLE = "backfill_checkpoints"
+
+
+class BackfillDryRun(Exception):
+    """dry-run の見積もりを出したあとマイグレーションを止めるための例外"""
+
+
+@dataclass
+class Backfill:
+    name: str                       # チェックポイントのキー（マイグレーション内で一意）
+    table: str
+    pk: str                         # 単一列の主キー（順序付けに使う）
+    set_sql: str                    # 例: "price_cents = ROUND(price * 100)"
+    pending_sql: str = "1=1"        # 未処理行の条件（冪等にするため必ず指定推奨）
+    batch_size: int = 1000
+    min_batch_size: int = 50
+    max_batch_size: int = 10000
+    target_chunk_seconds: float = 0.2   # 1チャンクの目標時間（超えたら縮める）
+    pause_seconds: float = 0.05         # チャンク間の最低スリープ
+    max_lag_seconds: float = 5.0        # レプリカ遅延の許容値
+
+
+def _ensure_checkpoint_table(conn: Connection) -> None:
+    conn.execute(sa.text(
+        f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} ("
+        " name VARCHAR(100) NOT NULL PRIMARY KEY,"
+        " last_pk VARCHAR(255) NULL,"
+        " rows_done BIGINT NOT NULL DEFAULT 0,"
+        " finished TINYINT NOT NULL DEFAULT 0,"
+        " updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        ")"
+    ))
+
+
+def _load_checkpoint(conn: Connection, name: str) -> tuple[Optional[str], int, bool]:
+    row = conn.execute(
+        sa.text(f"SELECT last_pk, rows_done, finished FROM {CHECKPOINT_TABLE} WHERE name = :n"),
+        {"n": name},
+    ).first()
+    if row is None:
+        conn.execute(
+            sa.text(f"INSERT INTO {CHECKPOINT_TABLE} (name, rows_done, finished) VALUES (:n, 0, 0)"),
+            {"n": name},
+        )
+        return None, 0, False
+    return row.last_pk, int(row.rows_done), bool(row.finished)
+
+
+def _save_checkpoint(conn: Connection, name: str, last_pk, rows_done: int, finished: bool) -> None:
+    conn.execute(
+        sa.text(
+            f"UPDATE {CHECKPOINT_TABLE} SET last_pk = :pk, rows_done = :rows,"
+            " finished = :fin, updated_at = CURRENT_TIMESTAMP WHERE name = :n"
+        ),
+        {"pk": None if last_pk is None else str(last_pk), "rows": rows_done,
+         "fin": int(finished), "n": name},
+    )
+
+
+def replica_lag_seconds(conn: Connection) -> Optional[float]:
+    """MySQL のレプリカ遅延（取れない環境では None）"""
+    if conn.dialect.name != "mysql":
+        return None
+    for stmt, col in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                      ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+        try:
+            row = conn.execute(sa.text(stmt)).mappings().first()
+        except Exception:
+            continue
+        if row is None:
+            return None  # レプリカではない
+        value = row.get(col)
+        return float(value) if value is not None else None
+    return None
+
+
+def _peek_checkpoint(conn: Connection, name: str) -> tuple[Optional[str], int, bool]:
+    """チェックポイントを読むだけ（dry-run では表も行も作らない）"""
+    if not sa.inspect(conn).has_table(CHECKPOINT_TABLE):
+        return None, 0, False
+    row = conn.execute(
+        sa.text(f"SELECT last_pk, rows_done, finished FROM {CHECKPOINT_TABLE} WHERE name = :n"),
+        {"n": name},
+    ).first()
+    if row is None:
+        return None, 0, False
+    return row.last_pk, int(row.rows_done), bool(row.finished)
+
+
+def replica_lag_probe(url: str) -> Callable[[Connection], Optional[float]]:
+    """レプリカに接続して遅延を測る lag_probe を作る（backfill() の lag_probe に渡す）"""
+    connect_args = {}
+    if url.startswith("mysql"):
+        from backend.db_control.session import connect_args  # Azure は TLS 必須
+    engine = sa.create_engine(url, poolclass=sa.pool.NullPool, connect_args=connect_args)
+
+    def probe(_primary: Connection) -> Optional[float]:
+        with engine.connect() as replica:
+            return replica_lag_seconds(replica)
+
+    return probe
+
+
+def estimate(conn: Connection, bf: Backfill) -> dict:
+    """dry-run 用の見積もり
+
+    チャンクは主キー範囲で切るので、チャンク数は「チェックポイントより後ろの行数」から
+    出す（再開時は処理済みの範囲を数えない）。バッチサイズは実行中に増減するため、
+    estimated_chunks は初期の batch_size での目安。
+    """
+    last_pk, rows_done, finished = _peek_checkpoint(conn, bf.name)
+    total = conn.execute(sa.text(f"SELECT COUNT(*) FROM {bf.table}")).scalar_one()
+    if finished:
+        remaining = pending = 0
+    else:
+        after = f"{bf.pk} > :last AND " if last_pk is not None else ""
+        remaining, pending = conn.execute(
+            sa.text(
+                f"SELECT COUNT(*), COALESCE(SUM(CASE WHEN ({bf.pending_sql}) THEN 1 ELSE 0 END), 0)"
+                f" FROM {bf.table} WHERE {after}1=1"
+            ),
+            {"last": last_pk},
+        ).one()
+    return {
+        "name": bf.name,
+        "table": bf.table,
+        "total_rows": int(total),
+        "resume_after": last_pk,
+        "rows_done": rows_done,
+        "remaining_rows": int(remaining),
+        "pending_rows": int(pending),
+        "estimated_chunks": -(-int(remaining) // bf.batch_size),
+    }
+
+
+def backfill(conn: Connection, bf: Backfill,
+             lag_probe: Callable[[Connection], Optional[float]] = replica_lag_seconds,
+             log: Callable[[str], None] = print) -> int:
+    """主キー順のチャンクで UPDATE を流す。処理した行数を返す
+
+    conn は autocommit であること（チャンクごとに確定させるため）。
+    """
+    _ensure_checkpoint_table(conn)
+    last_pk, rows_done, finished = _load_checkpoint(conn, bf.name)
+    if finished:
+        log(f"[backfill] {bf.name}: already finished ({rows_done} rows)")
+        return 0
+
+    batch = bf.batch_size
+    processed = 0
+    while True:
+        # チャンクの上端（主キー）を決める：範囲 UPDATE にしてロック範囲を限定する
+        params = {"limit": batch}
+        where = ""
+        if last_pk is not None:
+            where = f"WHERE {bf.pk} > :last"
+            params["last"] = last_pk
+        upper = conn.execute(sa.text(
+            f"SELECT MAX({bf.pk}) FROM ("
+            f" SELECT {bf.pk} FROM {bf.table} {where} ORDER BY {bf.pk} LIMIT :limit"
+            f") AS chunk"
+        ), params).scalar()
+        if upper is None:
+            _save_checkpoint(conn, bf.name, last_pk, rows_done, True)
+            log(f"[backfill] {bf.name}: done ({rows_done} rows)")
+            return processed
+
+        lower_sql = f"{bf.pk} > :last AND " if last_pk is not None else ""
+        started = time.monotonic()
+        result = conn.execute(
+            sa.text(
+                f"UPDATE {bf.table} SET {bf.set_sql}"
+                f" WHERE {lower_sql}{bf.pk} <= :upper AND ({bf.pending_sql})"
+            ),
+            {"last": last_pk, "upper": upper},
+        )
+        elapsed = time.monotonic() - started
+
+        last_pk = upper
+        rows_done += result.rowcount or 0
+        processed += result.rowcount or 0
+        _save_checkpoint(conn, bf.name, last_pk, rows_done, False)
+
+        # レイテンシに応じてバッチサイズを調整（AIMD）
+        if elapsed > bf.target_chunk_seconds:
+            batch = max(bf.min_batch_size, batch // 2)
+        else:
+            batch = min(bf.max_batch_size, batch + bf.batch_size // 10 + 1)
+
+        # 書き込み負荷に比例して休む + レプリカが追いつくまで待つ
+        time.sleep(max(bf.pause_seconds, elapsed))
+        lag = lag_probe(conn)
+        while lag is not None and lag > bf.max_lag_seconds:
+            log(f"[backfill] {bf.name}: replica lag {lag:.1f}s, waiting")
+            time.sleep(min(lag, 10.0))
+            lag = lag_probe(conn)
+
+        log(f"[backfill] {bf.name}: {rows_done} rows (last {bf.pk}={last_pk}, batch={batch})")
+
+
+def run_backfill(*jobs: Backfill,
+                 lag_probe: Optional[Callable[[Connection], Optional[float]]] = None) -> None:
+    """Alembic の upgrade() から呼ぶ。トランザクション外（autocommit）で実行する
+
+    lag_probe を省略すると -x backfill_replica_url / BACKFILL_REPLICA_URL のレプリカを見る。
+    """
+    from alembic import op, context
+
+    x_args = context.get_x_argument(as_dictionary=True)
+    dry_run = x_args.get("backfill_dry_run", "").lower() in ("1", "true", "yes")
+    if lag_probe is None:
+        replica_url = x_args.get("backfill_replica_url") or os.getenv("BACKFILL_REPLICA_URL")
+        if replica_url:
+            lag_probe = replica_lag_probe(replica_url)
+        else:
+            print("[backfill] no replica URL; replica lag is not throttled", flush=True)
+            lag_probe = replica_lag_seconds
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        if dry_run:
+            for bf in jobs:
+                print(f"[backfill] dry-run: {estimate(conn, bf)}", flush=True)
+            raise BackfillDryRun("dry-run finished; revision not applied")
+        for bf in jobs:
+            backfill(conn, bf, lag_probe=lag_probe)
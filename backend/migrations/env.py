@@ -20,6 +20,7 @@ load_dotenv(ROOT / "backend" / ".env")
 # ---- アプリ側の Base と URL を再利用
 from backend.db_control.models import Base
 from backend.db_control.session import _db_url
+from backend.db_control.shards import MAIN, parse_shard_urls
 
 # Alembic 標準設定
 config = context.config
@@ -51,7 +52,27 @@ def get_url() -> str:
     return _db_url()  # mysql+pymysql://.../goodsun?charset=utf8mb4
 
 
+def get_targets() -> dict[str, str]:
+    """マイグレーション先：main と DB_SHARD_URLS の各シャード（-x shard=<名前> で 1 つだけ）
+
+    customers / purchases / purchase_details はシャードにあるので、スキーマ変更は全シャードに当てる。
+    alembic_version は DB ごとにあるので、途中で落ちても再実行すれば各シャードの続きから進む。
+    """
+    urls = {MAIN: get_url(), **parse_shard_urls(os.getenv("DB_SHARD_URLS", ""))}
+    only = context.get_x_argument(as_dictionary=True).get("shard")
+    if only:
+        if only not in urls:
+            raise ValueError(f"unknown shard: {only} (available: {', '.join(urls)})")
+        urls = {only: urls[only]}
+    return urls
+
+
 def run_migrations_offline() -> None:
+    # SQL の出力は 1 つの DB 分だけ（シャードごとに -x shard=<名前> を付けて出す）
+    url = get_url()
+    only = context.get_x_argument(as_dictionary=True).get("shard")
+    if only:
+        url = get_targets()[only]
     url = get_url()
     context.configure(
         url=url,
@@ -71,20 +92,23 @@ def run_migrations_online() -> None:
     # デバッグ用：どの CA を使ったかを INFO ログに出す
     print(f"[alembic] Using SSL CA: {ca}", flush=True)
 
-    engine = create_engine(
-        get_url(),
-        poolclass=pool.NullPool,
-        connect_args=connect_args,
-    )
-
-    with engine.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata,
-            compare_type=True,
+    for name, url in get_targets().items():
+        print(f"[alembic] Migrating shard: {name}", flush=True)
+        engine = create_engine(
+            url,
+            poolclass=pool.NullPool,
+            connect_args=connect_args if url.startswith("mysql") else {},
         )
-        with context.begin_transaction():
-            context.run_migrations()
+
+        with engine.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                compare_type=True,
+            )
+            with context.begin_transaction():
+                context.run_migrations()
+        engine.dispose()
 
 
 if context.is_offline_mode():
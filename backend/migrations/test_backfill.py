@@ -0,0 +1,89 @@
+# backend/migrations/test_backfill.py
+import os
+import tempfile
+
+import sqlalchemy as sa
+
+from backend.migrations.backfill import Backfill, backfill, estimate
+# ↑ リポジトリ直下で `python -m backend.migrations.test_backfill`（ローカルの SQLite ファイルで完結）
+
+
+class _Stop(Exception):
+    pass
+
+
+def _bf(**kw) -> Backfill:
+    return Backfill(name="items_price_cents", table="items", pk="item_id",
+                    set_sql="price_cents = price * 100", pending_sql="price_cents IS NULL",
+                    pause_seconds=0, **kw)
+
+
+def _stop_after(chunks: int):
+    seen = []
+
+    def probe(_conn):
+        seen.append(1)
+        if len(seen) >= chunks:
+            raise _Stop()
+        return None
+
+    return probe
+
+
+def _pending(conn) -> int:
+    return conn.execute(sa.text("SELECT COUNT(*) FROM items WHERE price_cents IS NULL")).scalar_one()
+
+
+def run():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = sa.create_engine(f"sqlite:///{os.path.join(tmpdir, 'backfill.db')}",
+                                  isolation_level="AUTOCOMMIT")
+        with engine.connect() as conn:
+            conn.execute(sa.text(
+                "CREATE TABLE items (item_id VARCHAR(10) PRIMARY KEY, price INT, price_cents INT)"
+            ))
+            conn.execute(sa.text("INSERT INTO items (item_id, price) VALUES (:i, :p)"),
+                         [{"i": f"I{n:03d}", "p": n} for n in range(25)])
+            logs = []
+
+            # 1) dry-run：表もチェックポイントも作らずに見積もる
+            est = estimate(conn, _bf(batch_size=10))
+            assert est["remaining_rows"] == 25 and est["estimated_chunks"] == 3, est
+            assert not sa.inspect(conn).has_table("backfill_checkpoints")
+
+            # 2) 2 チャンク目のあとで落ちる → 処理済みの範囲はチェックポイントに残る
+            try:
+                backfill(conn, _bf(batch_size=10, max_batch_size=10), lag_probe=_stop_after(2),
+                         log=logs.append)
+                raise AssertionError("probe did not stop the backfill")
+            except _Stop:
+                pass
+            assert _pending(conn) == 5
+
+            # 3) 再開前の見積もりはチェックポイントより後ろだけを数える
+            est = estimate(conn, _bf(batch_size=10))
+            assert est["resume_after"] == "I019" and est["rows_done"] == 20, est
+            assert est["remaining_rows"] == 5 and est["estimated_chunks"] == 1, est
+
+            # 4) 再開すると残りだけ処理して完了、もう一度流しても何もしない
+            assert backfill(conn, _bf(batch_size=10), lag_probe=lambda c: None, log=logs.append) == 5
+            assert _pending(conn) == 0
+            assert conn.execute(sa.text("SELECT price_cents FROM items WHERE item_id = 'I024'")
+                                ).scalar_one() == 2400
+            assert backfill(conn, _bf(batch_size=10), lag_probe=lambda c: None, log=logs.append) == 0
+            assert estimate(conn, _bf())["remaining_rows"] == 0
+
+            # 5) レプリカ遅延が許容値を超えている間は次のチャンクに進まない
+            conn.execute(sa.text("UPDATE items SET price_cents = NULL"))
+            lags = iter([0.05, None])
+            backfill(conn, _bf(name="lagged", batch_size=25, max_lag_seconds=0.0),
+                     lag_probe=lambda c: next(lags), log=logs.append)
+            assert any("replica lag" in line for line in logs), logs
+            assert _pending(conn) == 0
+        engine.dispose()
+
+    print("backfill: OK")
+
+
+if __name__ == "__main__":
+    run()
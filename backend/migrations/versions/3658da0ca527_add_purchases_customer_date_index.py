@@ -0,0 +1,31 @@
+"""add purchases (customer_id, purchase_date, purchase_id) index
+
+Revision ID: 3658da0ca527
+Revises: 70257eb5656e
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3658da0ca527'
+down_revision: Union[str, None] = '70257eb5656e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # GET /customers/{id}/purchases のキーセットページングをインデックスだけで辿れるようにする
+    op.create_index(
+        'ix_purchases_customer_date',
+        'purchases',
+        ['customer_id', 'purchase_date', 'purchase_id'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_purchases_customer_date', table_name='purchases')
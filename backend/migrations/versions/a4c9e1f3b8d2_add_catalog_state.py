@@ -0,0 +1,33 @@
+"""add catalog_state
+
+Revision ID: a4c9e1f3b8d2
+Revises: e83f0b6c2d15
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e1f3b8d2'
+down_revision: Union[str, None] = 'e83f0b6c2d15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 共有カタログの版番号（items を変更するトランザクションで +1 する。常に id=1 の 1 行）
+    op.create_table(
+        'catalog_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_catalog_state')),
+    )
+    op.execute("INSERT INTO catalog_state (id, version) VALUES (1, 1)")
+
+
+def downgrade() -> None:
+    op.drop_table('catalog_state')
@@ -0,0 +1,27 @@
+"""add runner_id to jobs
+
+Revision ID: b5d2f7a9c3e1
+Revises: a4c9e1f3b8d2
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2f7a9c3e1'
+down_revision: Union[str, None] = 'a4c9e1f3b8d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # どのランナーが running にしたか（ハートビートと完了の更新を自分のジョブに限る）
+    op.add_column('jobs', sa.Column('runner_id', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('jobs', 'runner_id')
@@ -0,0 +1,92 @@
+"""partition purchases by purchase_date (monthly)
+
+Revision ID: b7e2c41d9a03
+Revises: 3658da0ca527
+Create Date: 2026-10-19 11:00:00.000000
+
+MySQL のパーティション表には次の制約があるので、合わせてスキーマを変える。
+
+- すべての一意キー（主キー含む）にパーティションキーを含める
+  → 主キーを (purchase_id, purchase_date) にする
+- 外部キーを持てない / 参照されることもできない
+  → purchases→customers と purchase_details→purchases の FK を外し、
+    ON DELETE CASCADE の代わりに AFTER DELETE トリガーで消す
+    （DROP PARTITION ではトリガーは動かない。月次の入れ替えは db_control/partitions.py）
+    INSERT 時の purchase_id の一意性と親の存在チェックは c3e8a1f5d7b9 の BEFORE INSERT トリガー
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c41d9a03'
+down_revision: Union[str, None] = '3658da0ca527'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+
+def _month_start(d: date, offset: int = 0) -> date:
+    m = d.year * 12 + (d.month - 1) + offset
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def _drop_fks(table: str, referred_table: str) -> None:
+    # FK 名は create_all 任せだったので、実際の名前を information_schema から引く
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if fk["referred_table"] == referred_table:
+            op.drop_constraint(fk["name"], table, type_="foreignkey")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    _drop_fks('purchase_details', 'purchases')
+    _drop_fks('purchases', 'customers')
+    op.execute("ALTER TABLE purchases DROP PRIMARY KEY, ADD PRIMARY KEY (purchase_id, purchase_date)")
+
+    # 既存データの最古の月から、今月 + MONTHS_AHEAD までを月次パーティションにする
+    oldest = bind.execute(sa.text("SELECT MIN(purchase_date) FROM purchases")).scalar()
+    today = date.today()
+    month = _month_start(oldest or today)
+    last = _month_start(today, MONTHS_AHEAD)
+    parts = []
+    while month <= last:
+        nxt = _month_start(month, 1)
+        parts.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{nxt.isoformat()}')")
+        month = nxt
+    parts.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    op.execute(
+        "ALTER TABLE purchases PARTITION BY RANGE COLUMNS(purchase_date) (\n    "
+        + ",\n    ".join(parts)
+        + "\n)"
+    )
+
+    # FK の ON DELETE CASCADE の代わり（customers → purchases → purchase_details と連鎖する）
+    op.execute(
+        "CREATE TRIGGER trg_customers_delete_purchases AFTER DELETE ON customers"
+        " FOR EACH ROW DELETE FROM purchases WHERE customer_id = OLD.customer_id"
+    )
+    op.execute(
+        "CREATE TRIGGER trg_purchases_delete_details AFTER DELETE ON purchases"
+        " FOR EACH ROW DELETE FROM purchase_details WHERE purchase_id = OLD.purchase_id"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_purchases_delete_details")
+    op.execute("DROP TRIGGER IF EXISTS trg_customers_delete_purchases")
+    op.execute("ALTER TABLE purchases REMOVE PARTITIONING")
+    op.execute("ALTER TABLE purchases DROP PRIMARY KEY, ADD PRIMARY KEY (purchase_id)")
+    op.create_foreign_key(
+        'purchases_ibfk_1', 'purchases', 'customers',
+        ['customer_id'], ['customer_id'], ondelete='CASCADE',
+    )
+    op.create_foreign_key(
+        'purchase_details_ibfk_1', 'purchase_details', 'purchases',
+        ['purchase_id'], ['purchase_id'], ondelete='CASCADE',
+    )
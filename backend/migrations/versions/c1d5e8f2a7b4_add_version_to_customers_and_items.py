@@ -0,0 +1,29 @@
+"""add version to customers and items
+
+Revision ID: c1d5e8f2a7b4
+Revises: b7e2c41d9a03
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1d5e8f2a7b4'
+down_revision: Union[str, None] = 'b7e2c41d9a03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 既存行は 1 から始める（server_default なので一括 UPDATE は不要）
+    op.add_column('customers', sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+    op.add_column('items', sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('items', 'version')
+    op.drop_column('customers', 'version')
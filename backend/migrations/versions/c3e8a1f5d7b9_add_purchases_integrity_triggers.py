@@ -0,0 +1,56 @@
+"""add purchases integrity triggers
+
+Revision ID: c3e8a1f5d7b9
+Revises: b5d2f7a9c3e1
+Create Date: 2026-10-19 17:00:00.000000
+
+b7e2c41d9a03 でパーティション化のために外した制約の代わり。
+
+- 主キーが (purchase_id, purchase_date) になったので、日付違いの同じ purchase_id が入り得る
+- purchases→customers / purchase_details→purchases の FK が無いので、親の無い行が入り得る
+
+BEFORE INSERT トリガーで、外した FK と purchase_id の一意性を担う。MYSQL_ERRNO は
+本来の重複（1062）/ FK 違反（1452）と同じにするので、ドライバーからは IntegrityError として
+返り、crud の unique_violation の扱いもそのまま使える。FK と同じく親は共有ロックで読み、
+同じ purchase_id の同時 INSERT はロック読みのギャップロックで片方が待つ（またはデッドロックで戻る）。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a1f5d7b9'
+down_revision: Union[str, None] = 'b5d2f7a9c3e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE TRIGGER trg_purchases_before_insert BEFORE INSERT ON purchases"
+        " FOR EACH ROW BEGIN"
+        "  IF EXISTS (SELECT 1 FROM purchases WHERE purchase_id = NEW.purchase_id FOR UPDATE) THEN"
+        "   SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1062,"
+        "    MESSAGE_TEXT = 'Duplicate entry for key purchases.purchase_id';"
+        "  END IF;"
+        "  IF NOT EXISTS (SELECT 1 FROM customers WHERE customer_id = NEW.customer_id FOR SHARE) THEN"
+        "   SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,"
+        "    MESSAGE_TEXT = 'Cannot add purchases row: customer does not exist';"
+        "  END IF;"
+        " END"
+    )
+    op.execute(
+        "CREATE TRIGGER trg_purchase_details_before_insert BEFORE INSERT ON purchase_details"
+        " FOR EACH ROW BEGIN"
+        "  IF NOT EXISTS (SELECT 1 FROM purchases WHERE purchase_id = NEW.purchase_id FOR SHARE) THEN"
+        "   SIGNAL SQLSTATE '23000' SET MYSQL_ERRNO = 1452,"
+        "    MESSAGE_TEXT = 'Cannot add purchase_details row: purchase does not exist';"
+        "  END IF;"
+        " END"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_purchase_details_before_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_purchases_before_insert")
@@ -0,0 +1,43 @@
+"""add jobs table
+
+Revision ID: e83f0b6c2d15
+Revises: c1d5e8f2a7b4
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e83f0b6c2d15'
+down_revision: Union[str, None] = 'c1d5e8f2a7b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'jobs',
+        sa.Column('job_id', sa.String(length=32), nullable=False),
+        sa.Column('job_type', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), server_default=sa.text("'queued'"), nullable=False),
+        sa.Column('params', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('progress', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('message', sa.String(length=255), nullable=True),
+        sa.Column('cancel_requested', sa.Boolean(), server_default=sa.text('0'), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('job_id', name=op.f('pk_jobs')),
+    )
+    op.create_index('ix_jobs_status_type_created', 'jobs', ['status', 'job_type', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_status_type_created', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,105 @@
+# backend/test_admission.py
+import asyncio
+
+from admission import (
+    PRIORITY_BULK, PRIORITY_NORMAL, PRIORITY_WRITE,
+    AdaptiveLimit, AdmissionController, Rejected,
+)
+# ↑ backend ディレクトリで `python -m test_admission`（DB なし・標準ライブラリだけで完結）
+
+
+def _controller(limit: int, queue: int = 5, budget: float = 1.0) -> AdmissionController:
+    priorities = (PRIORITY_WRITE, PRIORITY_NORMAL, PRIORITY_BULK)
+    return AdmissionController(
+        AdaptiveLimit(initial=limit, max_limit=limit),
+        queue_sizes={p: queue for p in priorities},
+        wait_budgets={p: budget for p in priorities},
+    )
+
+
+def check_limit():
+    # 1) 負荷なし：0.3ms の点検索と 30ms の一覧が混ざっても limit は縮まない
+    limit = AdaptiveLimit(initial=10)
+    for i in range(2000):
+        limit.observe(0.0003 if i % 2 else 0.030, "GET read_one" if i % 2 else "GET read_all")
+    assert limit.current == 10, limit.limit
+
+    # 2) 詰まって処理時間が急に 5 倍になると縮む
+    for i in range(20):
+        limit.observe(0.0015 if i % 2 else 0.150, "GET read_one" if i % 2 else "GET read_all")
+    assert limit.current < 10, limit.limit
+    assert limit.current >= limit.min_limit
+
+
+async def check_controller():
+    # 3) 空いた枠は優先度の高い順（同じ優先度なら到着順）に渡る
+    ctl = _controller(limit=1)
+    await ctl.acquire(PRIORITY_NORMAL)
+    order = []
+
+    async def wait(priority, name):
+        await ctl.acquire(priority)
+        order.append(name)
+
+    tasks = [asyncio.create_task(wait(p, n)) for p, n in
+             [(PRIORITY_BULK, "bulk"), (PRIORITY_NORMAL, "normal"), (PRIORITY_WRITE, "write")]]
+    await asyncio.sleep(0)
+    for _ in range(3):
+        ctl.release(0.01)
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    assert order == ["write", "normal", "bulk"], order
+    assert ctl.in_flight == 1
+    ctl.release(0.01)
+    assert ctl.in_flight == 0
+
+    # 4) キュー満杯なら待たせずに拒否
+    ctl = _controller(limit=1, queue=1)
+    await ctl.acquire(PRIORITY_WRITE)
+    waiter = asyncio.create_task(ctl.acquire(PRIORITY_BULK))
+    await asyncio.sleep(0)
+    try:
+        await ctl.acquire(PRIORITY_BULK)
+        raise AssertionError("queue overflow was admitted")
+    except Rejected as e:
+        assert e.retry_after >= 1.0
+
+    # 5) 待っている間に切断されたら、キューから外れて枠も漏れない
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert ctl._counts[PRIORITY_BULK] == 0 and not ctl._waiters
+    ctl.release(0.01)
+    assert ctl.in_flight == 0
+
+    # 6) 枠を渡された直後に切断されても枠は漏れない
+    #    （キャンセルされれば枠を返す / Python によっては取得済みとして返るので呼び出し側が返す）
+    ctl = _controller(limit=1)
+    await ctl.acquire(PRIORITY_NORMAL)
+    waiter = asyncio.create_task(ctl.acquire(PRIORITY_NORMAL))
+    await asyncio.sleep(0)
+    ctl.release(0.01)  # waiter に枠が渡る
+    waiter.cancel()
+    result, = await asyncio.gather(waiter, return_exceptions=True)
+    if not isinstance(result, asyncio.CancelledError):
+        ctl.release(0.01)
+    assert ctl.in_flight == 0, ctl.in_flight
+
+    # 7) 待ち時間の予算を超えたら 503 用に拒否
+    ctl = _controller(limit=1, budget=0.05)
+    await ctl.acquire(PRIORITY_NORMAL)
+    try:
+        await ctl.acquire(PRIORITY_NORMAL)
+        raise AssertionError("request waited past its budget")
+    except Rejected:
+        pass
+    assert ctl.in_flight == 1 and not ctl._waiters
+
+
+def run():
+    check_limit()
+    asyncio.run(check_controller())
+    print("admission: OK")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,107 @@
+# backend/test_api.py
+import os
+import tempfile
+
+# app を import する前に：ジョブランナーは動かさず、共有カタログは一時ディレクトリに置く
+_tmpdir = tempfile.TemporaryDirectory()
+os.environ["JOB_RUNNER"] = "off"
+os.environ["CATALOG_PATH"] = os.path.join(_tmpdir.name, "catalog.bin")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import app
+from backend.db_control.models import Base
+from backend.db_control.session import get_db
+from backend.db_control.shards import MAIN, ShardRouter, set_router
+# ↑ リポジトリ直下で `python -m backend.test_api`（ローカルの SQLite ファイルで完結）
+
+
+def check_customers(client: TestClient):
+    body = {"customer_id": "C001", "customer_name": "楽観太郎", "age": 30, "gender": "M"}
+    assert client.post("/customers", json=body).json()["version"] == 1
+    r = client.get("/customers", params={"customer_id": "C001"})
+    assert r.headers["ETag"] == '"1"', r.headers
+
+    # 1) version なしの PUT は 428（後勝ちの上書きはさせない）
+    assert client.put("/customers", json=body).status_code == 428
+
+    # 2) If-Match が合えば更新して新しい ETag、古い If-Match はもう一度使うと 409
+    r = client.put("/customers", json={**body, "age": 31}, headers={"If-Match": '"1"'})
+    assert r.status_code == 200 and r.headers["ETag"] == '"2"', r.text
+    r = client.put("/customers", json={**body, "age": 32}, headers={"If-Match": '"1"'})
+    assert r.status_code == 409, r.text
+    assert client.get("/customers", params={"customer_id": "C001"}).json()["age"] == 31
+
+    # 3) body の version でも同じ（If-Match が無いとき）、無い顧客は 404
+    r = client.put("/customers", json={**body, "version": 2})
+    assert r.status_code == 200 and r.json()["version"] == 3, r.text
+    r = client.put("/customers", json={**body, "customer_id": "C999"}, headers={"If-Match": '"1"'})
+    assert r.status_code == 404, r.text
+    assert client.put("/customers", json=body, headers={"If-Match": "abc"}).status_code == 400
+
+    # 4) DELETE も If-Match が古ければ 409、合えば削除、消えた後は 404
+    params = {"customer_id": "C001"}
+    assert client.delete("/customers", params=params, headers={"If-Match": '"2"'}).status_code == 409
+    assert client.delete("/customers", params=params, headers={"If-Match": 'W/"3"'}).status_code == 200
+    assert client.delete("/customers", params=params).status_code == 404
+    assert client.get("/customers", params=params).status_code == 404
+
+
+def check_items(client: TestClient):
+    r = client.post("/items", json={"item_name": "りんご", "price": "100"})
+    assert r.status_code == 200, r.text
+    item_id = r.json()["item_id"]
+    assert r.json()["version"] == 1
+
+    # 1) PUT は If-Match 必須、合えば ETag が進み、一覧（共有カタログ）にもすぐ出る
+    payload = {"item_name": "青りんご", "price": "120"}
+    assert client.put(f"/items/{item_id}", json=payload).status_code == 428
+    r = client.put(f"/items/{item_id}", json=payload, headers={"If-Match": '"1"'})
+    assert r.status_code == 200 and r.headers["ETag"] == '"2"', r.text
+    listed = {i["item_id"]: i for i in client.get("/items").json()}
+    assert listed[item_id]["item_name"] == "青りんご" and listed[item_id]["version"] == 2, listed
+
+    # 2) 古い If-Match は 409、無い商品は 404
+    r = client.put(f"/items/{item_id}", json=payload, headers={"If-Match": '"1"'})
+    assert r.status_code == 409, r.text
+    r = client.put("/items/INOPE", json=payload, headers={"If-Match": '"1"'})
+    assert r.status_code == 404, r.text
+
+    # 3) DELETE：古い If-Match は 409、合えば削除されて一覧から消え、もう一度消すと 404
+    assert client.delete(f"/items/{item_id}", headers={"If-Match": '"1"'}).status_code == 409
+    assert client.delete(f"/items/{item_id}", headers={"If-Match": '"2"'}).status_code == 200
+    assert item_id not in {i["item_id"] for i in client.get("/items").json()}
+    assert client.delete(f"/items/{item_id}").status_code == 404
+
+
+def run():
+    engine = create_engine(f"sqlite:///{os.path.join(_tmpdir.name, 'api.db')}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    def _get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    set_router(ShardRouter({MAIN: engine}))
+    app.dependency_overrides[get_db] = _get_db
+    try:
+        with TestClient(app) as client:
+            check_customers(client)
+            check_items(client)
+    finally:
+        app.dependency_overrides.clear()
+        set_router(None)
+        engine.dispose()
+        _tmpdir.cleanup()
+
+    print("api: OK")
+
+
+if __name__ == "__main__":
+    run()
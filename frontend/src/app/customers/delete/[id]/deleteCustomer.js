@@ -1,10 +1,15 @@
-export default async function deleteCustomer(id) {
+export default async function deleteCustomer(id, version) {
   const res = await fetch(
     process.env.NEXT_PUBLIC_API_ENDPOINT + `/customers?customer_id=${id}`,
     {
       method: "DELETE",
+      // 表示している内容から変わっていたら削除しない
+      headers: version != null ? { "If-Match": `"${version}"` } : {},
     }
   );
+  if (res.status === 409) {
+    throw new Error("Customer was updated by someone else. Reload and try again.");
+  }
   if (!res.ok) {
     throw new Error("Failed to delete customer");
   }
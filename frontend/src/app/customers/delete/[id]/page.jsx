@@ -21,7 +21,7 @@ export default function DeletePage(props) {
 
   const handleSubmit = async (event) => {
     event.preventDefault();
-    await deleteCustomer(customer_id);
+    await deleteCustomer(customer_id, customer?.version);
     router.push(`./delete/confirm?customer_id=${customer_id}`);
   };
 
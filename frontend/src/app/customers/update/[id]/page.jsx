@@ -30,12 +30,14 @@ export default function UpdatePage(props) {
   const previous_customer_id = customerInfo.customer_id;
   const previous_age = customerInfo.age;
   const previous_gender = customerInfo.gender;
+  const previous_version = customerInfo.version;
 
   return (
     <>
       <div className="card bordered bg-white border-blue-200 border-2 max-w-md m-4">
         <div className="m-4 card bordered bg-blue-200 duration-200 hover:border-r-red">
           <form ref={formRef} onSubmit={handleSubmit}>
+            <input type="hidden" name="version" defaultValue={previous_version} />
             <div className="card-body">
               <h2 className="card-title">
                 <p>
@@ -3,6 +3,8 @@ export default async function updateCustomer(formData) {
   const updated_customer_id = formData.get("customer_id");
   const updated_age = parseInt(formData.get("age"));
   const updated_gender = formData.get("gender");
+  // 読み込んだときの version。サーバーは一致したときだけ更新する（後勝ちにしない）
+  const version = formData.get("version");
 
   const body_msg = JSON.stringify({
     customer_name: updated_customer_name,
@@ -16,10 +18,15 @@ export default async function updateCustomer(formData) {
     headers: {
       "Content-Type": "application/json",
       Accept: "application/json",
+      "If-Match": `"${version}"`,
     },
     body: body_msg,
   });
+  if (res.status === 409) {
+    throw new Error("Customer was updated by someone else. Reload and try again.");
+  }
   if (!res.ok) {
     throw new Error("Failed to update customer");
   }
+  return res.json();
 }